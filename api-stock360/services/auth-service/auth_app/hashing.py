@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import HTTPException
+from prometheus_client import Counter, Gauge
+
+from .security import hash_password, verify_password
+
+logger = logging.getLogger(__name__)
+
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_PENDING = int(
+    os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 8))
+)
+PASSWORD_HASH_RETRY_AFTER = os.getenv("PASSWORD_HASH_RETRY_AFTER", "1")
+
+HASH_JOBS_PENDING = Gauge(
+    "password_hash_jobs_pending",
+    "Password hash/verify jobs queued or running in the hashing pool",
+)
+
+HASH_JOBS_REJECTED_TOTAL = Counter(
+    "password_hash_jobs_rejected_total",
+    "Password hash/verify jobs rejected because the hashing pool was saturated",
+)
+
+PASSWORD_REHASH_TOTAL = Counter(
+    "password_rehash_total",
+    "Stored password hashes upgraded to the current argon2 parameters",
+    ["result"],
+)
+
+
+class PasswordHashingPool:
+    """Runs argon2 hashing off the event loop with a bounded backlog.
+
+    Jobs beyond ``max_pending`` are rejected with a 503 instead of queueing
+    indefinitely, so a login storm cannot starve health checks and /metrics.
+    """
+
+    def __init__(
+        self,
+        kind: str = PASSWORD_HASH_EXECUTOR,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING,
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError("PASSWORD_HASH_EXECUTOR must be 'thread' or 'process'")
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: Executor | None = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="argon2"
+                )
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_pending:
+            HASH_JOBS_REJECTED_TOTAL.inc()
+            raise HTTPException(
+                status_code=503,
+                detail="Authentication service is busy, please retry shortly.",
+                headers={"Retry-After": PASSWORD_HASH_RETRY_AFTER},
+            )
+
+        self.pending += 1
+        HASH_JOBS_PENDING.inc()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.pending -= 1
+            HASH_JOBS_PENDING.dec()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def start(self) -> None:
+        self._get_executor()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHashingPool()
+
+
+async def rehash_password(db, user_id, password: str, old_hash: str) -> None:
+    """Replace ``old_hash`` with a hash using the current parameters.
+
+    Runs after the login response is sent. The update only applies if the
+    stored hash is still ``old_hash``, so a password change made meanwhile
+    is never overwritten; a saturated pool just defers to the next login.
+    """
+    try:
+        new_hash = await password_hasher.hash(password)
+    except HTTPException:
+        PASSWORD_REHASH_TOTAL.labels(result="deferred").inc()
+        return
+
+    try:
+        result = await db["users"].update_one(
+            {"_id": user_id, "password": old_hash}, {"$set": {"password": new_hash}}
+        )
+    except Exception as exc:
+        logger.warning("Failed to store upgraded password hash: %s", exc)
+        PASSWORD_REHASH_TOTAL.labels(result="failed").inc()
+        return
+    PASSWORD_REHASH_TOTAL.labels(
+        result="upgraded" if result.modified_count else "superseded"
+    ).inc()
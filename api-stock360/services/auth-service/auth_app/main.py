@@ -1,77 +1,23 @@
-import time
+import asyncio
+import logging
 
 from fastapi import FastAPI
-from prometheus_client import Counter, Histogram, make_asgi_app
-from starlette.requests import Request
+from prometheus_client import make_asgi_app
 
-from .database import close_db, init_db
+from .database import close_db, ensure_indexes, init_db, warm_pool
+from .metrics import PrometheusMiddleware
+from .hashing import password_hasher
+from .messaging import user_event_publisher
+from .outbox import start_outbox_relay
 from .routes.auth import router as auth_router
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="Auth Service")
 
 AUTH_SERVICE_NAME = "auth-service"
 
-REQUESTS_TOTAL = Counter(
-    "http_requests_total",
-    "Total HTTP Requests",
-    ["method", "endpoint", "status_code", "service"],
-)
-
-REQUEST_ERRORS_TOTAL = Counter(
-    "http_error_requests_total",
-    "Total HTTP Error Requests",
-    ["method", "endpoint", "status_code", "service"],
-)
-
-REQUEST_LATENCY = Histogram(
-    "http_request_duration_seconds",
-    "HTTP Request Latency",
-    ["method", "endpoint", "service"],
-    buckets=[0.05, 0.1, 0.3, 0.5, 1, 2, 5],
-)
-
-
-@app.middleware("http")
-async def add_prometheus_metrics(request: Request, call_next):
-    start_time = time.time()
-    endpoint = request.url.path
-    method = request.method
-
-    try:
-        response = await call_next(request)
-        status_code = response.status_code
-    except Exception as e:
-        status_code = 500
-        REQUEST_ERRORS_TOTAL.labels(
-            method=method,
-            endpoint=endpoint,
-            status_code=status_code,
-            service=AUTH_SERVICE_NAME,
-        ).inc()
-        raise e
-    else:
-        if 400 <= status_code < 600:
-            REQUEST_ERRORS_TOTAL.labels(
-                method=method,
-                endpoint=endpoint,
-                status_code=status_code,
-                service=AUTH_SERVICE_NAME,
-            ).inc()
-
-    REQUESTS_TOTAL.labels(
-        method=method,
-        endpoint=endpoint,
-        status_code=status_code,
-        service=AUTH_SERVICE_NAME,
-    ).inc()
-
-    latency = time.time() - start_time
-    REQUEST_LATENCY.labels(
-        method=method, endpoint=endpoint, service=AUTH_SERVICE_NAME
-    ).observe(latency)
-
-    return response
-
+app.add_middleware(PrometheusMiddleware, service_name=AUTH_SERVICE_NAME)
 
 metrics_app = make_asgi_app()
 app.mount("/metrics", metrics_app)
@@ -80,11 +26,29 @@ app.mount("/metrics", metrics_app)
 @app.on_event("startup")
 async def startup_event():
     init_db(app)
+    await warm_pool(app)
+    await ensure_indexes(app)
+    password_hasher.start()
+    try:
+        await user_event_publisher.start()
+    except Exception as exc:
+        # The publisher reconnects lazily on the first publish
+        logger.warning("RabbitMQ publisher not available at startup: %s", exc)
+    app.state.outbox_relay = start_outbox_relay(app)
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    relay = getattr(app.state, "outbox_relay", None)
+    if relay:
+        relay.cancel()
+        try:
+            await relay
+        except asyncio.CancelledError:
+            pass
     close_db(app)
+    password_hasher.shutdown()
+    await user_event_publisher.close()
 
 
 @app.get("/")
@@ -0,0 +1,135 @@
+from time import perf_counter
+
+from prometheus_client import Counter, Gauge, Histogram
+from starlette.routing import Mount
+
+# Label used for requests that did not match any route (404s, scanners, ...)
+UNMATCHED_ENDPOINT = "<unmatched>"
+
+REQUESTS_TOTAL = Counter(
+    "http_requests_total",
+    "Total HTTP Requests",
+    ["method", "endpoint", "status_code", "service"],
+)
+
+REQUEST_ERRORS_TOTAL = Counter(
+    "http_error_requests_total",
+    "Total HTTP Error Requests",
+    ["method", "endpoint", "status_code", "service"],
+)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP Request Latency",
+    ["method", "endpoint", "service"],
+    buckets=[0.05, 0.1, 0.3, 0.5, 1, 2, 5],
+)
+
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP Requests currently being served",
+    ["method", "service"],
+)
+
+BODY_SIZE_BUCKETS = [100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+
+REQUEST_SIZE = Histogram(
+    "http_request_size_bytes",
+    "HTTP Request body size",
+    ["method", "endpoint", "service"],
+    buckets=BODY_SIZE_BUCKETS,
+)
+
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "HTTP Response body size",
+    ["method", "endpoint", "service"],
+    buckets=BODY_SIZE_BUCKETS,
+)
+
+
+def get_route_template(scope) -> str:
+    """Return the matched route template (e.g. ``/tools/{item_id}``) for a request.
+
+    Must be called after routing ran. Labelling metrics by template instead of
+    the raw path keeps one time series per route instead of one per document.
+    """
+    path = scope.get("path", "")
+    route = scope.get("route")
+    path_regex = getattr(route, "path_regex", None)
+
+    if path_regex is not None:
+        # Routes of included routers only know their own path, so recover the
+        # router prefix as the part of the request path in front of the match.
+        for index, char in enumerate(path):
+            if char == "/" and path_regex.match(path[index:]):
+                return path[:index] + route.path_format
+        return route.path_format
+
+    for mount in getattr(scope.get("app"), "routes", ()):
+        if isinstance(mount, Mount) and (
+            path == mount.path or path.startswith(mount.path + "/")
+        ):
+            return mount.path
+
+    return UNMATCHED_ENDPOINT
+
+
+class PrometheusMiddleware:
+    """Pure ASGI middleware recording request count, latency, sizes and in-flight requests.
+
+    Unlike ``@app.middleware("http")`` it does not wrap the request in a
+    separate task and passes response chunks straight through, so streaming
+    responses are not buffered.
+    """
+
+    def __init__(self, app, service_name: str):
+        self.app = app
+        self.service_name = service_name
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        service = self.service_name
+        status_code = 500
+        request_size = 0
+        response_size = 0
+
+        async def receive_wrapper():
+            nonlocal request_size
+            message = await receive()
+            if message["type"] == "http.request":
+                request_size += len(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method, service)
+        in_progress.inc()
+        start_time = perf_counter()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except Exception:
+            status_code = 500
+            raise
+        finally:
+            latency = perf_counter() - start_time
+            in_progress.dec()
+
+            endpoint = get_route_template(scope)
+            status = str(status_code)
+            REQUESTS_TOTAL.labels(method, endpoint, status, service).inc()
+            if 400 <= status_code < 600:
+                REQUEST_ERRORS_TOTAL.labels(method, endpoint, status, service).inc()
+            REQUEST_LATENCY.labels(method, endpoint, service).observe(latency)
+            REQUEST_SIZE.labels(method, endpoint, service).observe(request_size)
+            RESPONSE_SIZE.labels(method, endpoint, service).observe(response_size)
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from prometheus_client import Counter
+
+from .messaging import UserEventPublisher, user_event_publisher
+
+logger = logging.getLogger(__name__)
+
+# Events live inside the document they describe, so they are written by the
+# same insert_one (a standalone mongod has no multi-document transactions)
+OUTBOX_SOURCE_COLLECTION = "users"
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "30"))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "1"))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "300"))
+
+# Relay bookkeeping on documents that still have pending_events; all of it is
+# removed once the events are delivered
+_RELAY_FIELDS = {
+    "outbox_available_at": "",
+    "outbox_lease_id": "",
+    "outbox_attempts": "",
+    "outbox_last_error": "",
+}
+
+OUTBOX_EVENTS_RELAYED_TOTAL = Counter(
+    "outbox_events_relayed_total",
+    "Outbox events published to RabbitMQ and removed from the outbox",
+)
+
+OUTBOX_EVENTS_RETRIED_TOTAL = Counter(
+    "outbox_events_retried_total",
+    "Outbox events rescheduled after a failed publish",
+)
+
+
+def build_outbox_event(routing_key: str, payload: dict) -> dict:
+    return {
+        "_id": str(ObjectId()),
+        "routing_key": routing_key,
+        "payload": payload,
+        "created_at": datetime.utcnow(),
+    }
+
+
+def add_pending_event(document: dict, routing_key: str, payload: dict) -> dict:
+    """Attach an event to a document that is about to be inserted."""
+    document.setdefault("pending_events", []).append(
+        build_outbox_event(routing_key, payload)
+    )
+    document["outbox_available_at"] = datetime.utcnow()
+    return document
+
+
+class OutboxRelay:
+    """Publishes the ``pending_events`` stored on user documents, in batches.
+
+    Documents are claimed by pushing ``outbox_available_at`` past a lease
+    deadline, so several replicas can relay concurrently and a document left
+    behind by a crashed replica becomes visible again once its lease expires.
+    Delivery is at-least-once: consumers must tolerate duplicates
+    (``message_id`` is the event id).
+    """
+
+    def __init__(
+        self,
+        publisher: UserEventPublisher = user_event_publisher,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+    ):
+        self.publisher = publisher
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wakeup: asyncio.Event | None = None
+
+    def notify(self) -> None:
+        """Wake the relay right away instead of waiting for the next poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def claim_batch(self, collection) -> list[dict]:
+        now = datetime.utcnow()
+        cursor = (
+            collection.find({"outbox_available_at": {"$lte": now}}, {"_id": 1})
+            .sort("outbox_available_at", 1)
+            .limit(self.batch_size)
+        )
+        candidate_ids = [doc["_id"] async for doc in cursor]
+        if not candidate_ids:
+            return []
+
+        lease_id = str(ObjectId())
+        await collection.update_many(
+            {"_id": {"$in": candidate_ids}, "outbox_available_at": {"$lte": now}},
+            {
+                "$set": {
+                    "outbox_available_at": now + timedelta(seconds=OUTBOX_LEASE_SECONDS),
+                    "outbox_lease_id": lease_id,
+                }
+            },
+        )
+        return [
+            doc
+            async for doc in collection.find(
+                {"_id": {"$in": candidate_ids}, "outbox_lease_id": lease_id},
+                {"pending_events": 1, "outbox_lease_id": 1, "outbox_attempts": 1},
+            )
+        ]
+
+    async def drain_once(self, collection) -> int:
+        documents = await self.claim_batch(collection)
+        if not documents:
+            return 0
+
+        by_routing_key = defaultdict(list)
+        for document in documents:
+            for event in document.get("pending_events", []):
+                by_routing_key[event["routing_key"]].append((document["_id"], event))
+
+        failed = {}
+        for routing_key, batch in by_routing_key.items():
+            try:
+                await self.publisher.publish_many(
+                    [event["payload"] for _, event in batch],
+                    routing_key=routing_key,
+                    message_ids=[event["_id"] for _, event in batch],
+                )
+            except Exception as exc:
+                logger.warning(
+                    "Failed to relay %s %s event(s): %s", len(batch), routing_key, exc
+                )
+                for document_id, _ in batch:
+                    failed[document_id] = exc
+
+        delivered = 0
+        for document in documents:
+            query = {"_id": document["_id"], "outbox_lease_id": document["outbox_lease_id"]}
+            events = document.get("pending_events", [])
+            if document["_id"] in failed:
+                await self._reschedule(collection, document, failed[document["_id"]])
+                continue
+            await collection.update_one(
+                query,
+                {
+                    "$pull": {"pending_events": {"_id": {"$in": [e["_id"] for e in events]}}},
+                    "$unset": _RELAY_FIELDS,
+                },
+            )
+            delivered += len(events)
+
+        if delivered:
+            OUTBOX_EVENTS_RELAYED_TOTAL.inc(delivered)
+        return len(documents)
+
+    async def _reschedule(self, collection, document: dict, exc: Exception):
+        attempts = document.get("outbox_attempts", 0) + 1
+        delay = min(
+            OUTBOX_RETRY_MAX_SECONDS, OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+        )
+        await collection.update_one(
+            {"_id": document["_id"], "outbox_lease_id": document["outbox_lease_id"]},
+            {
+                "$set": {
+                    "outbox_attempts": attempts,
+                    "outbox_available_at": datetime.utcnow() + timedelta(seconds=delay),
+                    "outbox_last_error": str(exc),
+                },
+                "$unset": {"outbox_lease_id": ""},
+            },
+        )
+        OUTBOX_EVENTS_RETRIED_TOTAL.inc(len(document.get("pending_events", [])))
+
+    async def run(self, app) -> None:
+        self._wakeup = asyncio.Event()
+        logger.info("Outbox relay started on collection: %s", OUTBOX_SOURCE_COLLECTION)
+
+        while True:
+            try:
+                relayed = await self.drain_once(app.mongodb[OUTBOX_SOURCE_COLLECTION])
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.error("Outbox relay iteration failed: %s", exc, exc_info=True)
+                relayed = 0
+
+            if relayed >= self.batch_size:
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+outbox_relay = OutboxRelay()
+
+
+def start_outbox_relay(app):
+    return asyncio.create_task(outbox_relay.run(app))
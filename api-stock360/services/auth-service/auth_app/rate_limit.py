@@ -0,0 +1,133 @@
+import math
+import os
+import time
+from typing import Protocol
+
+from fastapi import HTTPException, Request
+from prometheus_client import Counter
+
+LOGIN_RATE_LIMIT_EMAIL_BURST = int(os.getenv("LOGIN_RATE_LIMIT_EMAIL_BURST", "5"))
+LOGIN_RATE_LIMIT_EMAIL_PER_MINUTE = float(
+    os.getenv("LOGIN_RATE_LIMIT_EMAIL_PER_MINUTE", "5")
+)
+LOGIN_RATE_LIMIT_IP_BURST = int(os.getenv("LOGIN_RATE_LIMIT_IP_BURST", "20"))
+LOGIN_RATE_LIMIT_IP_PER_MINUTE = float(os.getenv("LOGIN_RATE_LIMIT_IP_PER_MINUTE", "30"))
+# Number of reverse proxies in front of the service (Kong = 1); 0 ignores
+# X-Forwarded-For and uses the peer address
+LOGIN_RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("LOGIN_RATE_LIMIT_TRUSTED_PROXIES", "0"))
+RATE_LIMIT_SHARDS = int(os.getenv("RATE_LIMIT_SHARDS", "16"))
+RATE_LIMIT_SWEEP_INTERVAL = float(os.getenv("RATE_LIMIT_SWEEP_INTERVAL", "60"))
+
+LOGIN_RATE_LIMITED_TOTAL = Counter(
+    "login_rate_limited_total",
+    "Login attempts rejected by the rate limiter before any lookup or hashing",
+    ["scope"],
+)
+
+
+class RateLimitBackend(Protocol):
+    async def hit(self, key: str, burst: int, per_second: float) -> float:
+        """Take one token for ``key``; return 0 if allowed, else seconds to wait."""
+
+
+class InMemoryTokenBucket:
+    """Token buckets in a sharded dict, local to the process.
+
+    A bucket that has refilled completely carries no information, so the
+    sweep (one shard per ``sweep_interval``, round-robin, run inline by
+    ``hit``) simply drops it. With several replicas each one enforces its own
+    limit; plug in a shared backend to enforce a global one.
+    """
+
+    def __init__(
+        self, shards: int = RATE_LIMIT_SHARDS, sweep_interval: float = RATE_LIMIT_SWEEP_INTERVAL
+    ):
+        # key -> [tokens, updated_at, seconds until full again]
+        self._shards: list[dict[str, list[float]]] = [{} for _ in range(max(1, shards))]
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+        self._sweep_cursor = 0
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    async def hit(self, key: str, burst: int, per_second: float) -> float:
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+        shard = self._shards[hash(key) % len(self._shards)]
+        bucket = shard.get(key)
+        if bucket is None:
+            bucket = shard[key] = [float(burst), now, 0.0]
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * per_second)
+            bucket[1] = now
+
+        allowed = bucket[0] >= 1
+        if allowed:
+            bucket[0] -= 1
+        bucket[2] = (burst - bucket[0]) / per_second
+        return 0.0 if allowed else (1 - bucket[0]) / per_second
+
+    def _sweep(self, now: float) -> None:
+        shard = self._shards[self._sweep_cursor]
+        for key in [k for k, (_, updated_at, ttl) in shard.items() if now - updated_at >= ttl]:
+            del shard[key]
+        self._sweep_cursor = (self._sweep_cursor + 1) % len(self._shards)
+        self._next_sweep = now + self.sweep_interval
+
+    def clear(self) -> None:
+        for shard in self._shards:
+            shard.clear()
+
+
+def client_ip(request: Request, trusted_proxies: int | None = None) -> str:
+    """Address of the client as seen by the outermost trusted proxy.
+
+    Each proxy appends the address it received the request from, so only the
+    last ``trusted_proxies`` X-Forwarded-For entries were written by our own
+    infrastructure; anything to their left is client-supplied and ignored.
+    """
+    if trusted_proxies is None:
+        trusted_proxies = LOGIN_RATE_LIMIT_TRUSTED_PROXIES
+    if trusted_proxies > 0:
+        forwarded = [
+            entry.strip()
+            for entry in request.headers.get("x-forwarded-for", "").split(",")
+            if entry.strip()
+        ]
+        if len(forwarded) >= trusted_proxies:
+            return forwarded[-trusted_proxies]
+    return request.client.host if request.client else "unknown"
+
+
+class LoginRateLimiter:
+    """Per client IP and per email throttling for /auth/login."""
+
+    def __init__(self, backend: RateLimitBackend | None = None):
+        self.backend = backend or InMemoryTokenBucket()
+
+    async def _take(self, scope: str, key: str, burst: int, per_minute: float) -> None:
+        retry_after = await self.backend.hit(f"{scope}:{key}", burst, per_minute / 60)
+        if retry_after > 0:
+            LOGIN_RATE_LIMITED_TOTAL.labels(scope=scope).inc()
+            raise HTTPException(
+                status_code=429,
+                detail="Too many login attempts, please retry later.",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+    async def check(self, request: Request, email: str) -> None:
+        await self._take(
+            "ip", client_ip(request), LOGIN_RATE_LIMIT_IP_BURST, LOGIN_RATE_LIMIT_IP_PER_MINUTE
+        )
+        await self._take(
+            "email",
+            email.strip().lower(),
+            LOGIN_RATE_LIMIT_EMAIL_BURST,
+            LOGIN_RATE_LIMIT_EMAIL_PER_MINUTE,
+        )
+
+
+login_rate_limiter = LoginRateLimiter()
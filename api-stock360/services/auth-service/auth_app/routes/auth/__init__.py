@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 
-from . import post
+from . import get, post
 
 router = APIRouter()
 router.include_router(post.router, tags=["POST"])
+router.include_router(get.router, tags=["GET"])
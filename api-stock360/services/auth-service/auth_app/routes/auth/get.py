@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, FastAPI
+
+from ...models import RevocationListResponse
+from ...tokens import list_revoked_jtis
+
+router = APIRouter()
+
+
+def get_app() -> FastAPI:
+    from ...main import app
+
+    return app
+
+
+@router.get(
+    "/revocations",
+    response_model=RevocationListResponse,
+    summary="Revoked access tokens",
+    description=(
+        "Lista ordenada dos `jti` de access tokens revogados que ainda não "
+        "expiraram. Os outros serviços carregam-na periodicamente e verificam "
+        "os tokens localmente, sem um pedido por cada chamada."
+    ),
+)
+async def get_revocations(app: FastAPI = Depends(get_app)):
+    return RevocationListResponse(
+        jti=await list_revoked_jtis(app.mongodb), generated_at=datetime.utcnow()
+    )
@@ -1,12 +1,33 @@
 from bson import ObjectId
-from fastapi import APIRouter, Depends, FastAPI, HTTPException
-
-from ...models import LoginRequest, TokenResponse, UserCreate, UserResponse
-from ...security import create_access_token, hash_password, verify_password
-from ...messaging import publish_user_created_event
+from fastapi import APIRouter, BackgroundTasks, Depends, FastAPI, HTTPException, Request
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pymongo.errors import DuplicateKeyError
+from starlette import status
+
+from ...models import (
+    LoginRequest,
+    LogoutRequest,
+    RefreshRequest,
+    TokenResponse,
+    UserCreate,
+    UserResponse,
+)
+from ...hashing import password_hasher, rehash_password
+from ...security import decode_token, password_needs_rehash
+from ...tokens import (
+    issue_tokens,
+    revoke_access_token,
+    revoke_refresh_token,
+    rotate_refresh_token,
+)
+from ...messaging import ROUTING_KEY_USER_CREATED
+from ...outbox import add_pending_event, outbox_relay
+from ...rate_limit import login_rate_limiter
 
 router = APIRouter()
 
+bearer_scheme = HTTPBearer(auto_error=False)
+
 
 def get_app() -> FastAPI:
     from ...main import app
@@ -18,60 +39,119 @@ def get_app() -> FastAPI:
     "/register",
     response_model=UserResponse,
     summary="Register user",
-    description="Regista um novo utilizador. Se o email já existir, devolve 400.",
+    description=(
+        "Regista um novo utilizador. Se o email já existir, devolve 400 (garantido "
+        "pelo índice único em `users.email`)."
+    ),
     responses={
         400: {"description": "User already exists"},
-        500: {"description": "Failed to insert or retrieve user"},
+        503: {"description": "Password hashing pool saturated"},
     },
 )
 async def register(user: UserCreate, app: FastAPI = Depends(get_app)):
-    existing = await app.mongodb["users"].find_one({"email": user.email})
-    if existing:
-        raise HTTPException(status_code=400, detail="User already exists")
-
     new_user = user.dict()
-    new_user["password"] = hash_password(new_user["password"])
+    new_user["password"] = await password_hasher.hash(new_user["password"])
     new_user["role"] = "user"
+    new_user["_id"] = str(ObjectId())
+
+    created = UserResponse(
+        id=new_user["_id"], name=new_user["name"], email=new_user["email"], role="user"
+    )
+    # The user.created event is stored in the user document itself, so the
+    # user and its event are written by the same insert_one or not at all
+    add_pending_event(
+        new_user,
+        ROUTING_KEY_USER_CREATED,
+        {
+            "id": created.id,
+            "name": created.name,
+            "email": created.email,
+            "role": created.role,
+        },
+    )
+
+    # Duplicate emails are rejected by the users.email_unique index, not by a
+    # lookup; startup fails if that index can't be built (REQUIRED_INDEXES)
+    try:
+        await app.mongodb["users"].insert_one(new_user)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="User already exists")
+    outbox_relay.notify()
 
-    new_user["_id"] = new_user.pop("id", str(ObjectId()))
-
-    result = await app.mongodb["users"].insert_one(new_user)
-
-    if result.inserted_id:
-        created = await app.mongodb["users"].find_one({"_id": new_user["_id"]})
-
-        if created:
-            created["id"] = str(created["_id"])
-
-            await publish_user_created_event(
-                {
-                    "id": created["id"],
-                    "name": user.name,
-                    "email": user.email,
-                    "role": "user",
-                }
-            )
-
-            return UserResponse(**created)
-        else:
-            raise Exception("User inserted but failed to retrieve immediately after.")
-    else:
-        raise Exception("Failed to insert user into the database.")
+    return created
 
 
 @router.post(
     "/login",
     response_model=TokenResponse,
     summary="User login",
-    description="Autentica um utilizador e devolve um token JWT quando as credenciais estão corretas.",
-    responses={401: {"description": "Invalid credentials"}},
+    description=(
+        "Autentica um utilizador e devolve um token JWT de curta duração e um "
+        "refresh token quando as credenciais estão corretas. As tentativas são "
+        "limitadas por IP e por email; acima do limite devolve 429 com "
+        "`Retry-After`, sem consultar a base de dados."
+    ),
+    responses={
+        401: {"description": "Invalid credentials"},
+        429: {"description": "Too many login attempts"},
+        503: {"description": "Password hashing pool saturated"},
+    },
 )
-async def login(request: LoginRequest, app: FastAPI = Depends(get_app)):
+async def login(
+    request: LoginRequest,
+    http_request: Request,
+    background_tasks: BackgroundTasks,
+    app: FastAPI = Depends(get_app),
+):
+    await login_rate_limiter.check(http_request, request.email)
+
     user = await app.mongodb["users"].find_one({"email": request.email})
 
-    if not user or not verify_password(request.password, user["password"]):
+    if not user or not await password_hasher.verify(
+        request.password, user["password"]
+    ):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    token = create_access_token(data={"sub": user["_id"], "role": user["role"]})
+    if password_needs_rehash(user["password"]):
+        background_tasks.add_task(
+            rehash_password, app.mongodb, user["_id"], request.password, user["password"]
+        )
+
+    return await issue_tokens(app.mongodb, user["_id"], user["role"])
+
+
+@router.post(
+    "/refresh",
+    response_model=TokenResponse,
+    summary="Refresh tokens",
+    description=(
+        "Troca um refresh token por um novo access token e um novo refresh token. "
+        "Cada refresh token só pode ser usado uma vez; reutilizar um token já "
+        "trocado revoga toda a sessão."
+    ),
+    responses={401: {"description": "Invalid, expired or reused refresh token"}},
+)
+async def refresh(request: RefreshRequest, app: FastAPI = Depends(get_app)):
+    return await rotate_refresh_token(app.mongodb, request.refresh_token)
 
-    return {"access_token": token, "token_type": "bearer"}
+
+@router.post(
+    "/logout",
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="Logout",
+    description=(
+        "Revoga o access token enviado no header Authorization (até expirar) e, "
+        "se indicado, o refresh token e toda a sua sessão."
+    ),
+)
+async def logout(
+    request: LogoutRequest,
+    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    app: FastAPI = Depends(get_app),
+):
+    if token:
+        claims = decode_token(token.credentials)
+        if claims:
+            await revoke_access_token(app.mongodb, claims)
+    if request.refresh_token:
+        await revoke_refresh_token(app.mongodb, request.refresh_token)
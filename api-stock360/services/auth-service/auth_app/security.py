@@ -1,4 +1,5 @@
 import os
+import uuid
 from datetime import datetime, timedelta
 
 from jose import JWTError, jwt
@@ -8,7 +9,27 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES")
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+
+def _argon2_settings() -> dict:
+    """ARGON2_TIME_COST / ARGON2_MEMORY_COST (KiB) / ARGON2_PARALLELISM.
+
+    Unset values keep passlib's defaults. Hashes made with other parameters
+    still verify and are upgraded on the next successful login.
+    """
+    settings = {}
+    for name in ("time_cost", "memory_cost", "parallelism"):
+        value = os.getenv(f"ARGON2_{name.upper()}")
+        if value:
+            settings[f"argon2__{name}"] = int(value)
+    if "argon2__time_cost" in settings:
+        # passlib only flags rounds outside [min_rounds, max_rounds] as outdated
+        settings["argon2__min_rounds"] = settings["argon2__max_rounds"] = settings[
+            "argon2__time_cost"
+        ]
+    return settings
+
+
+pwd_context = CryptContext(schemes=["argon2"], deprecated="auto", **_argon2_settings())
 
 
 def hash_password(password: str) -> str:
@@ -20,12 +41,17 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    return pwd_context.needs_update(hashed_password)
+
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (
         expires_delta or timedelta(minutes=int(ACCESS_TOKEN_EXPIRE_MINUTES))
     )
-    to_encode.update({"exp": expire})
+    # jti lets a single access token be revoked before it expires
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
@@ -0,0 +1,112 @@
+import hashlib
+import logging
+import os
+import secrets
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi import HTTPException
+from prometheus_client import Counter
+
+from .security import ACCESS_TOKEN_EXPIRE_MINUTES, create_access_token
+
+logger = logging.getLogger(__name__)
+
+REFRESH_TOKENS_COLLECTION = os.getenv("REFRESH_TOKENS_COLLECTION", "refresh_tokens")
+REVOKED_TOKENS_COLLECTION = os.getenv("REVOKED_TOKENS_COLLECTION", "revoked_tokens")
+REFRESH_TOKEN_EXPIRE_DAYS = float(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+
+REFRESH_TOKEN_REUSE_TOTAL = Counter(
+    "refresh_token_reuse_total",
+    "Already rotated refresh tokens presented again (their whole family is revoked)",
+)
+
+INVALID_REFRESH_TOKEN = "Invalid or expired refresh token"
+
+
+def hash_refresh_token(refresh_token: str) -> str:
+    # Only the digest is stored, so a database leak does not leak usable tokens
+    return hashlib.sha256(refresh_token.encode("utf-8")).hexdigest()
+
+
+async def issue_tokens(db, user_id: str, role: str, family_id: str | None = None) -> dict:
+    """Create an access token and a new opaque refresh token for the user.
+
+    Refresh tokens descending from the same login share a ``family_id``, so
+    a detected reuse can revoke the whole chain.
+    """
+    refresh_token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    await db[REFRESH_TOKENS_COLLECTION].insert_one(
+        {
+            "_id": hash_refresh_token(refresh_token),
+            "user_id": user_id,
+            "family_id": family_id or str(ObjectId()),
+            "created_at": now,
+            "expires_at": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+            "used_at": None,
+        }
+    )
+    return {
+        "access_token": create_access_token(data={"sub": user_id, "role": role}),
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+        "expires_in": int(ACCESS_TOKEN_EXPIRE_MINUTES) * 60,
+    }
+
+
+async def rotate_refresh_token(db, refresh_token: str) -> dict:
+    """Exchange a refresh token for a new token pair; each one works only once."""
+    collection = db[REFRESH_TOKENS_COLLECTION]
+    token_hash = hash_refresh_token(refresh_token)
+    now = datetime.utcnow()
+
+    stored = await collection.find_one_and_update(
+        {"_id": token_hash, "used_at": None, "expires_at": {"$gt": now}},
+        {"$set": {"used_at": now}},
+    )
+    if stored is None:
+        reused = await collection.find_one({"_id": token_hash})
+        if reused and reused.get("used_at"):
+            # Someone kept a copy of a rotated token: end the session everywhere
+            await collection.delete_many({"family_id": reused["family_id"]})
+            REFRESH_TOKEN_REUSE_TOTAL.inc()
+            logger.warning(
+                "Refresh token reuse detected for user %s; family revoked",
+                reused["user_id"],
+            )
+        raise HTTPException(status_code=401, detail=INVALID_REFRESH_TOKEN)
+
+    user = await db["users"].find_one({"_id": stored["user_id"]})
+    if not user:
+        raise HTTPException(status_code=401, detail=INVALID_REFRESH_TOKEN)
+
+    return await issue_tokens(db, stored["user_id"], user["role"], stored["family_id"])
+
+
+async def revoke_refresh_token(db, refresh_token: str) -> None:
+    collection = db[REFRESH_TOKENS_COLLECTION]
+    stored = await collection.find_one({"_id": hash_refresh_token(refresh_token)})
+    if stored:
+        await collection.delete_many({"family_id": stored["family_id"]})
+
+
+async def revoke_access_token(db, claims: dict) -> None:
+    """Add the token's jti to the revocation list until the token expires anyway."""
+    jti, exp = claims.get("jti"), claims.get("exp")
+    if not jti or not exp:
+        return
+    await db[REVOKED_TOKENS_COLLECTION].update_one(
+        {"_id": jti},
+        {"$set": {"expires_at": datetime.utcfromtimestamp(exp)}},
+        upsert=True,
+    )
+
+
+async def list_revoked_jtis(db) -> list[str]:
+    cursor = (
+        db[REVOKED_TOKENS_COLLECTION]
+        .find({"expires_at": {"$gt": datetime.utcnow()}}, {"_id": 1})
+        .sort("_id", 1)
+    )
+    return [doc["_id"] async for doc in cursor]
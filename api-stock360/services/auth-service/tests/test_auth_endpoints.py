@@ -5,6 +5,7 @@ import pytest
 import pytest_asyncio
 import importlib
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 from httpx import AsyncClient, ASGITransport
 
@@ -23,6 +24,7 @@ from auth_app.main import app  # noqa: E402
 
 # import hash_password to prepare test flows
 from auth_app.security import hash_password  # noqa: E402
+from auth_app.rate_limit import login_rate_limiter  # noqa: E402
 
 
 class InsertResult:
@@ -30,11 +32,21 @@ class InsertResult:
         self.inserted_id = inserted_id
 
 
+class UpdateResult:
+    def __init__(self, modified_count=0):
+        self.modified_count = modified_count
+
+
 class FakeCollection:
-    def __init__(self):
+    def __init__(self, unique=()):
         self._data = {}
+        self._unique = unique
+        self.find_one_calls = 0
 
     async def insert_one(self, doc):
+        for field in self._unique:
+            if any(d.get(field) == doc.get(field) for d in self._data.values()):
+                raise DuplicateKeyError(f"E11000 duplicate key error: {field}")
         _id = doc.get("_id") or str(ObjectId())
         if isinstance(_id, ObjectId):
             pass
@@ -43,7 +55,8 @@ class FakeCollection:
         self._data[_id] = stored
         return InsertResult(_id)
 
-    async def find_one(self, query):
+    async def find_one(self, query, projection=None):
+        self.find_one_calls += 1
         # support queries by _id or email
         if "_id" in query:
             _id = query.get("_id")
@@ -58,14 +71,94 @@ class FakeCollection:
                     return dict(doc)
         return None
 
+    def _match_filter(self, doc, query):
+        # equality plus the $in / $lte / $gt operators used by the outbox relay and tokens
+        for k, v in query.items():
+            value = doc.get(k)
+            if isinstance(v, dict):
+                if "$in" in v and value not in v["$in"]:
+                    return False
+                if "$lte" in v and (value is None or value > v["$lte"]):
+                    return False
+                if "$gt" in v and (value is None or value <= v["$gt"]):
+                    return False
+            elif value != v:
+                return False
+        return True
+
+    def find(self, query=None, projection=None):
+        query = query or {}
+
+        class AsyncCursor:
+            def __init__(self, items):
+                self._items = items
+
+            def sort(self, key, direction=1):
+                self._items.sort(key=lambda d: d.get(key), reverse=direction < 0)
+                return self
+
+            def limit(self, n):
+                self._items = self._items[:n]
+                return self
+
+            def __aiter__(self):
+                self._iter = iter(self._items)
+                return self
+
+            async def __anext__(self):
+                try:
+                    return next(self._iter)
+                except StopIteration:
+                    raise StopAsyncIteration
+
+        items = [
+            dict(doc) for doc in self._data.values() if self._match_filter(doc, query)
+        ]
+        return AsyncCursor(items)
+
+    async def update_one(self, query, update, upsert=False):
+        for doc in self._data.values():
+            if self._match_filter(doc, query):
+                doc.update(update.get("$set", {}))
+                for key in update.get("$unset", {}):
+                    doc.pop(key, None)
+                for key, condition in update.get("$pull", {}).items():
+                    ids = condition["_id"]["$in"]
+                    doc[key] = [item for item in doc.get(key, []) if item["_id"] not in ids]
+                return UpdateResult(1)
+        if upsert:
+            self._data[query["_id"]] = {"_id": query["_id"], **update.get("$set", {})}
+        return UpdateResult(0)
+
+    async def find_one_and_update(self, query, update):
+        for doc in self._data.values():
+            if self._match_filter(doc, query):
+                before = dict(doc)
+                doc.update(update.get("$set", {}))
+                return before
+        return None
+
+    async def update_many(self, query, update):
+        for doc in self._data.values():
+            if self._match_filter(doc, query):
+                doc.update(update.get("$set", {}))
+
+    async def delete_many(self, query):
+        for _id in [
+            _id for _id, doc in self._data.items() if self._match_filter(doc, query)
+        ]:
+            del self._data[_id]
+
 
 class FakeDB:
     def __init__(self):
-        self.users = FakeCollection()
+        self.users = FakeCollection(unique=("email",))
+        self.refresh_tokens = FakeCollection()
+        self.revoked_tokens = FakeCollection()
 
     def __getitem__(self, name):
-        if name == "users":
-            return self.users
+        if name in ("users", "refresh_tokens", "revoked_tokens"):
+            return getattr(self, name)
         raise KeyError(name)
 
 
@@ -101,6 +194,7 @@ def set_fake_db(monkeypatch):
         pass
 
     app.mongodb = fake_db
+    login_rate_limiter.backend.clear()
     yield
 
 
@@ -120,6 +214,13 @@ async def test_register_and_login(ac):
     assert r.status_code in (200, 201)
     created = r.json()
     assert created.get("email") == payload["email"]
+    assert created.get("id") in app.mongodb.users._data
+    assert app.mongodb.users.find_one_calls == 0
+
+    r = await ac.post("/auth/register", json={**payload, "name": "Again"})
+    assert r.status_code == 400
+    assert len(app.mongodb.users._data) == 1
+    assert len(app.mongodb.users._data[created["id"]]["pending_events"]) == 1
 
     # login
     login_payload = {"email": payload["email"], "password": payload["password"]}
@@ -146,3 +247,350 @@ async def test_login_invalid_credentials(ac):
         "/auth/login", json={"email": "u@example.com", "password": "wrong"}
     )
     assert r.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_login_rejected_when_hashing_pool_saturated(ac, monkeypatch):
+    from auth_app.hashing import password_hasher
+
+    monkeypatch.setattr(password_hasher, "max_pending", 0)
+
+    r = await ac.post(
+        "/auth/login", json={"email": "nobody@example.com", "password": "x"}
+    )
+    # unknown users never reach the pool
+    assert r.status_code == 401
+
+    user_id = str(ObjectId())
+    app.mongodb.users._data[user_id] = {
+        "_id": user_id,
+        "name": "U",
+        "email": "busy@example.com",
+        "password": hash_password("mypassword"),
+        "role": "user",
+    }
+    r = await ac.post(
+        "/auth/login", json={"email": "busy@example.com", "password": "mypassword"}
+    )
+    assert r.status_code == 503
+    assert r.headers.get("Retry-After")
+
+
+class FakeExchange:
+    def __init__(self, published):
+        self._published = published
+
+    async def publish(self, message, routing_key, timeout=None):
+        self._published.append((routing_key, message.body))
+
+
+class FakeChannel:
+    is_closed = False
+
+    def __init__(self, published):
+        self._published = published
+
+    async def declare_exchange(self, *args, **kwargs):
+        return FakeExchange(self._published)
+
+    async def get_exchange(self, name, ensure=True):
+        return FakeExchange(self._published)
+
+    async def close(self):
+        pass
+
+
+class FakeConnection:
+    is_closed = False
+
+    def __init__(self):
+        self.published = []
+
+    async def channel(self, publisher_confirms=True):
+        return FakeChannel(self.published)
+
+    async def close(self):
+        self.is_closed = True
+
+
+@pytest.mark.asyncio
+async def test_publisher_reuses_connection(monkeypatch):
+    from auth_app import messaging
+
+    connections = []
+
+    async def fake_connect_robust(url):
+        connection = FakeConnection()
+        connections.append(connection)
+        return connection
+
+    monkeypatch.setattr(messaging.aio_pika, "connect_robust", fake_connect_robust)
+    publisher = messaging.UserEventPublisher(pool_size=2)
+
+    await publisher.publish({"id": "1"})
+    await publisher.publish_many([{"id": "2"}, {"id": "3"}])
+    await publisher.close()
+
+    assert len(connections) == 1
+    assert [key for key, _ in connections[0].published] == ["user.created"] * 3
+
+
+class RecordingPublisher:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.published = []
+
+    async def publish_many(self, payloads, routing_key, message_ids=None):
+        if self.fail:
+            raise ConnectionError("broker down")
+        self.published.extend((routing_key, p) for p in payloads)
+
+
+@pytest.mark.asyncio
+async def test_register_stores_event_in_user_document_and_relay_drains_it(ac):
+    from auth_app.outbox import OutboxRelay
+
+    payload = {"name": "Out Box", "email": "outbox@example.com", "password": "pw"}
+    r = await ac.post("/auth/register", json=payload)
+    assert r.status_code == 200
+    user = app.mongodb.users._data[r.json()["id"]]
+    assert [e["routing_key"] for e in user["pending_events"]] == ["user.created"]
+
+    failing = OutboxRelay(publisher=RecordingPublisher(fail=True))
+    assert await failing.drain_once(app.mongodb.users) == 1
+    assert user["outbox_attempts"] == 1
+    assert len(user["pending_events"]) == 1
+    assert "outbox_lease_id" not in user
+
+    # make the rescheduled event due again
+    user["outbox_available_at"] = user["pending_events"][0]["created_at"]
+    publisher = RecordingPublisher()
+    relay = OutboxRelay(publisher=publisher)
+    assert await relay.drain_once(app.mongodb.users) == 1
+    assert publisher.published[0][0] == "user.created"
+    assert publisher.published[0][1]["email"] == payload["email"]
+    assert user["pending_events"] == []
+    assert not any(key.startswith("outbox_") for key in user)
+    assert await relay.drain_once(app.mongodb.users) == 0
+
+
+@pytest.mark.asyncio
+async def test_event_survives_a_crash_right_after_the_user_insert(monkeypatch):
+    from auth_app.outbox import OutboxRelay, outbox_relay
+
+    def crash():
+        raise RuntimeError("process died after insert_one")
+
+    monkeypatch.setattr(outbox_relay, "notify", crash)
+    transport = ASGITransport(app=app, raise_app_exceptions=False)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        payload = {"name": "Crash", "email": "crash@example.com", "password": "pw"}
+        r = await client.post("/auth/register", json=payload)
+    assert r.status_code == 500
+
+    # the user and its event were written together, so nothing is lost
+    (user,) = app.mongodb.users._data.values()
+    assert user["pending_events"][0]["payload"]["email"] == "crash@example.com"
+    publisher = RecordingPublisher()
+    assert await OutboxRelay(publisher=publisher).drain_once(app.mongodb.users) == 1
+    assert [p["id"] for _, p in publisher.published] == [user["_id"]]
+
+
+@pytest.mark.asyncio
+async def test_login_is_throttled_per_email_and_ip(ac, monkeypatch):
+    from prometheus_client import REGISTRY
+
+    from auth_app import rate_limit
+    from auth_app.rate_limit import InMemoryTokenBucket
+
+    lookups = []
+    original_find_one = app.mongodb.users.find_one
+
+    async def counting_find_one(query):
+        lookups.append(query)
+        return await original_find_one(query)
+
+    monkeypatch.setattr(app.mongodb.users, "find_one", counting_find_one)
+    monkeypatch.setattr(rate_limit, "LOGIN_RATE_LIMIT_EMAIL_BURST", 2)
+    monkeypatch.setattr(rate_limit, "LOGIN_RATE_LIMIT_IP_BURST", 3)
+    before = REGISTRY.get_sample_value("login_rate_limited_total", {"scope": "email"}) or 0
+
+    attempt = {"email": "Victim@example.com", "password": "guess"}
+    for _ in range(2):
+        r = await ac.post("/auth/login", json=attempt)
+        assert r.status_code == 401
+    r = await ac.post("/auth/login", json={**attempt, "email": "victim@example.com"})
+    assert r.status_code == 429
+    assert int(r.headers["retry-after"]) >= 1
+    assert len(lookups) == 2
+    assert REGISTRY.get_sample_value("login_rate_limited_total", {"scope": "email"}) == before + 1
+
+    # the IP bucket was drained by the same attempts
+    r = await ac.post("/auth/login", json={"email": "other@example.com", "password": "x"})
+    assert r.status_code == 429
+    assert len(lookups) == 2
+
+    # buckets that have refilled completely are evicted by the sweep
+    clock = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: clock[0])
+    bucket = InMemoryTokenBucket(shards=1, sweep_interval=10)
+    assert await bucket.hit("ip:a", 2, 1) == 0
+    assert await bucket.hit("ip:b", 1, 1) == 0
+    assert await bucket.hit("ip:b", 1, 1) == 1
+    clock[0] += 1.5
+    await bucket.hit("ip:c", 1, 1)
+    assert len(bucket) == 3
+    clock[0] += 10
+    await bucket.hit("ip:c", 1, 1)
+    assert len(bucket) == 1
+
+
+@pytest.mark.asyncio
+async def test_login_upgrades_outdated_password_hash(ac):
+    from passlib.context import CryptContext
+    from prometheus_client import REGISTRY
+
+    from auth_app.security import pwd_context, verify_password
+
+    old_context = CryptContext(schemes=["argon2"], argon2__memory_cost=8192)
+    old_hash = old_context.hash("mypassword")
+    assert pwd_context.needs_update(old_hash)
+    user_id = str(ObjectId())
+    app.mongodb.users._data[user_id] = {
+        "_id": user_id,
+        "name": "Legacy",
+        "email": "legacy@example.com",
+        "password": old_hash,
+        "role": "user",
+    }
+    upgraded = {"result": "upgraded"}
+    before = REGISTRY.get_sample_value("password_rehash_total", upgraded) or 0
+
+    login = {"email": "legacy@example.com", "password": "mypassword"}
+    r = await ac.post("/auth/login", json=login)
+    assert r.status_code == 200
+
+    new_hash = app.mongodb.users._data[user_id]["password"]
+    assert new_hash != old_hash
+    assert not pwd_context.needs_update(new_hash)
+    assert verify_password("mypassword", new_hash)
+    assert REGISTRY.get_sample_value("password_rehash_total", upgraded) == before + 1
+
+    # already current: nothing is rewritten
+    r = await ac.post("/auth/login", json=login)
+    assert r.status_code == 200
+    assert app.mongodb.users._data[user_id]["password"] == new_hash
+
+
+@pytest.mark.asyncio
+async def test_refresh_rotation_reuse_detection_and_logout(ac):
+    from auth_app.security import decode_token
+
+    payload = {"name": "Rotating", "email": "rot@example.com", "password": "secret"}
+    assert (await ac.post("/auth/register", json=payload)).status_code == 200
+    r = await ac.post(
+        "/auth/login", json={"email": payload["email"], "password": payload["password"]}
+    )
+    assert r.status_code == 200
+    first = r.json()
+    assert decode_token(first["access_token"])["jti"]
+    # only the digest of the refresh token is stored
+    assert first["refresh_token"] not in app.mongodb.refresh_tokens._data
+
+    r = await ac.post("/auth/refresh", json={"refresh_token": first["refresh_token"]})
+    assert r.status_code == 200
+    second = r.json()
+    assert second["refresh_token"] != first["refresh_token"]
+    assert decode_token(second["access_token"])["sub"] == decode_token(
+        first["access_token"]
+    )["sub"]
+
+    # replaying the rotated token revokes the whole family, including `second`
+    r = await ac.post("/auth/refresh", json={"refresh_token": first["refresh_token"]})
+    assert r.status_code == 401
+    r = await ac.post("/auth/refresh", json={"refresh_token": second["refresh_token"]})
+    assert r.status_code == 401
+
+    r = await ac.post(
+        "/auth/login", json={"email": payload["email"], "password": payload["password"]}
+    )
+    third = r.json()
+    r = await ac.post(
+        "/auth/logout",
+        json={"refresh_token": third["refresh_token"]},
+        headers={"Authorization": f"Bearer {third['access_token']}"},
+    )
+    assert r.status_code == 204
+    r = await ac.post("/auth/refresh", json={"refresh_token": third["refresh_token"]})
+    assert r.status_code == 401
+
+    r = await ac.get("/auth/revocations")
+    assert r.status_code == 200
+    assert r.json()["jti"] == [decode_token(third["access_token"])["jti"]]
+
+
+@pytest.mark.asyncio
+async def test_startup_fails_when_email_unique_index_cannot_be_built():
+    from pymongo.errors import OperationFailure
+
+    from auth_app.database import ensure_indexes
+
+    class IndexedCollection(FakeCollection):
+        def __init__(self, fail=False):
+            super().__init__()
+            self.fail = fail
+
+        async def index_information(self):
+            return {"_id_": {}}
+
+        async def create_indexes(self, indexes):
+            if self.fail:
+                raise OperationFailure("E11000 duplicate key error collection: users")
+            return [index.document["name"] for index in indexes]
+
+    class IndexedDB:
+        def __init__(self, failing):
+            self.collections = {}
+            self.failing = failing
+
+        def __getitem__(self, name):
+            return self.collections.setdefault(name, IndexedCollection(name == self.failing))
+
+    class App:
+        class state:
+            pass
+
+    fake_app = App()
+    fake_app.mongodb = IndexedDB(failing="revoked_tokens")
+    report = await ensure_indexes(fake_app)
+    assert report["revoked_tokens"]["failed"] == ["expires_at_ttl"]
+
+    fake_app.mongodb = IndexedDB(failing="users")
+    with pytest.raises(RuntimeError, match="users.email_unique"):
+        await ensure_indexes(fake_app)
+
+
+@pytest.mark.asyncio
+async def test_login_behind_proxy_is_limited_per_real_client(ac, monkeypatch):
+    from auth_app import rate_limit
+
+    monkeypatch.setattr(rate_limit, "LOGIN_RATE_LIMIT_TRUSTED_PROXIES", 1)
+    monkeypatch.setattr(rate_limit, "LOGIN_RATE_LIMIT_IP_BURST", 2)
+
+    async def attempt(forwarded_for, email):
+        return await ac.post(
+            "/auth/login",
+            json={"email": email, "password": "x"},
+            headers={"X-Forwarded-For": forwarded_for},
+        )
+
+    # every request comes from the gateway's address; the appended entry is the client
+    for i in range(2):
+        assert (await attempt("203.0.113.7", f"a{i}@example.com")).status_code == 401
+    assert (await attempt("203.0.113.7", "a9@example.com")).status_code == 429
+    # other clients behind the same gateway keep their own budget
+    assert (await attempt("198.51.100.4", "b@example.com")).status_code == 401
+
+    # a spoofed leftmost entry does not buy a fresh bucket
+    r = await attempt("10.9.9.9, 203.0.113.7", "c@example.com")
+    assert r.status_code == 429
@@ -0,0 +1,185 @@
+import logging
+import os
+
+from prometheus_client import Counter, Gauge, Histogram
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+MONGO_SLOW_COMMAND_MS = float(os.getenv("MONGO_SLOW_COMMAND_MS", "100"))
+
+# errtype values pymongo reports when a command fails at the network level
+NETWORK_ERROR_TYPES = {
+    "AutoReconnect",
+    "ConnectionFailure",
+    "NetworkTimeout",
+    "ServerSelectionTimeoutError",
+    "WaitQueueTimeoutError",
+}
+
+# commands whose first field holds something other than a collection name
+_COLLECTION_FIELD = {"getMore": "collection"}
+
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting to check a connection out of the Mongo pool",
+    buckets=[0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1, 5],
+)
+
+DB_POOL_CHECKOUT_FAILURES_TOTAL = Counter(
+    "db_pool_checkout_failures_total",
+    "Connection checkouts from the Mongo pool that failed",
+    ["reason"],
+)
+
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Open connections in the Mongo pool",
+    ["address"],
+)
+
+DB_POOL_CONNECTIONS_IN_USE = Gauge(
+    "db_pool_connections_in_use",
+    "Connections currently checked out of the Mongo pool",
+    ["address"],
+)
+
+DB_COMMAND_DURATION = Histogram(
+    "db_command_duration_seconds",
+    "Mongo command round-trip time as seen by the driver",
+    ["command", "collection"],
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5],
+)
+
+DB_COMMAND_FAILURES_TOTAL = Counter(
+    "db_command_failures_total",
+    "Mongo commands that returned an error",
+    ["command", "collection"],
+)
+
+DB_CONNECTION_ERRORS_TOTAL = Counter(
+    "db_connection_errors_total",
+    "Network-level errors talking to Mongo",
+    ["source"],
+)
+
+DB_POOL_MAX_SIZE = Gauge(
+    "db_pool_max_size",
+    "Configured maxPoolSize of the Mongo client",
+)
+
+
+def _address(event) -> str:
+    host, port = event.address
+    return f"{host}:{port}"
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Feeds pymongo connection pool events into Prometheus."""
+
+    def pool_created(self, event):
+        DB_POOL_CONNECTIONS.labels(address=_address(event)).set(0)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        DB_POOL_CONNECTIONS.labels(address=_address(event)).set(0)
+        DB_POOL_CONNECTIONS_IN_USE.labels(address=_address(event)).set(0)
+
+    def connection_created(self, event):
+        DB_POOL_CONNECTIONS.labels(address=_address(event)).inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        DB_POOL_CONNECTIONS.labels(address=_address(event)).dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        DB_POOL_CHECKOUT_WAIT.observe(event.duration)
+        DB_POOL_CHECKOUT_FAILURES_TOTAL.labels(reason=str(event.reason)).inc()
+        if event.reason == monitoring.ConnectionCheckOutFailedReason.CONN_ERROR:
+            DB_CONNECTION_ERRORS_TOTAL.labels(source="checkout").inc()
+
+    def connection_checked_out(self, event):
+        DB_POOL_CHECKOUT_WAIT.observe(event.duration)
+        DB_POOL_CONNECTIONS_IN_USE.labels(address=_address(event)).inc()
+
+    def connection_checked_in(self, event):
+        DB_POOL_CONNECTIONS_IN_USE.labels(address=_address(event)).dec()
+
+
+def _collection_name(command_name: str, command: dict) -> str:
+    value = command.get(_COLLECTION_FIELD.get(command_name, command_name))
+    return value if isinstance(value, str) else "-"
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Records per-command/per-collection latency and failures, logs slow commands."""
+
+    def __init__(self, slow_command_ms: float = MONGO_SLOW_COMMAND_MS):
+        self.slow_command_ms = slow_command_ms
+        # started events carry the command body; finished events only the ids
+        self._collections = {}
+
+    @staticmethod
+    def _key(event):
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        self._collections[self._key(event)] = _collection_name(
+            event.command_name, event.command
+        )
+
+    def _finish(self, event) -> tuple[str, float]:
+        collection = self._collections.pop(self._key(event), "-")
+        duration = event.duration_micros / 1_000_000
+        DB_COMMAND_DURATION.labels(
+            command=event.command_name, collection=collection
+        ).observe(duration)
+
+        if duration * 1000 >= self.slow_command_ms:
+            logger.warning(
+                "Slow Mongo command %s on %s.%s took %.1f ms",
+                event.command_name,
+                event.database_name,
+                collection,
+                duration * 1000,
+            )
+        return collection, duration
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        collection, _ = self._finish(event)
+        DB_COMMAND_FAILURES_TOTAL.labels(
+            command=event.command_name, collection=collection
+        ).inc()
+        if event.failure.get("errtype") in NETWORK_ERROR_TYPES:
+            DB_CONNECTION_ERRORS_TOTAL.labels(source="command").inc()
+
+
+class HeartbeatMetricsListener(monitoring.ServerHeartbeatListener):
+    """Counts failed server heartbeats as connection errors."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        DB_CONNECTION_ERRORS_TOTAL.labels(source="heartbeat").inc()
+        logger.warning("Mongo heartbeat to %s failed: %s", event.connection_id, event.reply)
+
+
+def get_event_listeners() -> list:
+    return [PoolMetricsListener(), CommandMetricsListener(), HeartbeatMetricsListener()]
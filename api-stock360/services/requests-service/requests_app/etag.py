@@ -0,0 +1,74 @@
+import hashlib
+import json
+from datetime import datetime
+
+from fastapi import HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+
+
+def serialize(content) -> bytes:
+    """Encode a response body the same way FastAPI's JSONResponse does."""
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def timestamp_etag(resource_id, updated_at: datetime) -> str:
+    """ETag from a document's id and updated_at, known before serializing it."""
+    key = f"{resource_id}:{updated_at.isoformat()}".encode("utf-8")
+    return f'"{hashlib.blake2b(key, digest_size=12).hexdigest()}"'
+
+
+def content_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def _header_tags(request: Request, name: str) -> list[str] | None:
+    header = request.headers.get(name)
+    if header is None:
+        return None
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for GET)."""
+    tags = _header_tags(request, "if-none-match")
+    if not tags:
+        return False
+    return "*" in tags or etag in {tag.removeprefix("W/") for tag in tags}
+
+
+def has_if_match(request: Request) -> bool:
+    return request.headers.get("if-match") is not None
+
+
+def check_if_match(request: Request, etag: str) -> None:
+    """Reject a write with 412 unless If-Match names the current representation."""
+    tags = _header_tags(request, "if-match")
+    if tags is None or "*" in tags or etag in tags:
+        return
+    raise HTTPException(
+        status_code=412,
+        detail="Precondition failed: the resource was modified by someone else",
+        headers={"ETag": etag},
+    )
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def etag_json_response(request: Request, body: bytes, etag: str) -> Response:
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+
+def conditional_json_response(request: Request, content) -> Response:
+    """Serialize once, tag the body with a content hash and honour If-None-Match."""
+    body = serialize(content)
+    return etag_json_response(request, body, content_etag(body))
@@ -6,8 +6,11 @@ from fastapi import (
     FastAPI,
     HTTPException,
     Query,
+    Request,
+    Response,
 )
 from starlette import status
+from ...etag import conditional_json_response, is_not_modified, not_modified, timestamp_etag
 from ...models import (
     UserInToken,
     RequestResponse,
@@ -30,6 +33,7 @@ def get_app() -> FastAPI:
     summary="Get request",
     description="Recupera uma requisição pelo seu ID. Apenas o dono ou um admin podem aceder.",
     responses={
+        304: {"description": "Not modified"},
         400: {"description": "Invalid Request ID format"},
         403: {"description": "Forbidden"},
         404: {"description": "Request not found"},
@@ -37,6 +41,8 @@ def get_app() -> FastAPI:
 )
 async def get_request(
     request_id: str,
+    http_request: Request,
+    response: Response,
     app: FastAPI = Depends(get_app),
     current_user: UserInToken = Depends(get_current_user),
 ):
@@ -59,6 +65,11 @@ async def get_request(
             ),
         )
 
+    etag = timestamp_etag(object_id, request["updated_at"])
+    if is_not_modified(http_request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+
     request["id"] = str(request.pop("_id"))
     return RequestResponse(**request)
 
@@ -72,6 +83,7 @@ async def get_request(
     responses={200: {"description": "Lista de requisições retornada"}},
 )
 async def list_requests(
+    http_request: Request,
     app: FastAPI = Depends(get_app),
     current_user: UserInToken = Depends(get_current_user),
     user_id: Optional[str] = Query(
@@ -101,7 +113,7 @@ async def list_requests(
         request["id"] = str(request.pop("_id"))
         requests_list.append(RequestResponse(**request))
 
-    return requests_list
+    return conditional_json_response(http_request, requests_list)
 
 
 @router.get(
@@ -113,6 +125,7 @@ async def list_requests(
     responses={400: {"description": "Invalid date format"}},
 )
 async def get_requests_by_date_range(
+    http_request: Request,
     start_date: str = Query(..., description="Start date in YYYY-MM-DD format"),
     end_date: str = Query(..., description="End date in YYYY-MM-DD format"),
     app: FastAPI = Depends(get_app),
@@ -142,4 +155,4 @@ async def get_requests_by_date_range(
         request["id"] = str(request.pop("_id"))
         requests_list.append(RequestResponse(**request))
 
-    return requests_list
+    return conditional_json_response(http_request, requests_list)
@@ -4,10 +4,13 @@ from fastapi import (
     Depends,
     FastAPI,
     HTTPException,
+    Request,
+    Response,
 )
 from typing import Dict, Any
 from datetime import datetime
 from starlette import status
+from ...etag import check_if_match, has_if_match, timestamp_etag
 from ...models import (
     RequestUpdate,
     RequestResponse,
@@ -30,17 +33,21 @@ def get_app() -> FastAPI:
     summary="Update request",
     description=(
         "Atualiza uma requisição existente. Só o dono ou admin pode atualizar; "
-        "apenas admin pode alterar o status."
+        "apenas admin pode alterar o status. Com `If-Match`, só atualiza se a "
+        "requisição não mudou desde esse `ETag` (412 caso contrário)."
     ),
     responses={
         400: {"description": "Invalid Request ID format"},
         403: {"description": "Forbidden"},
         404: {"description": "Request not found"},
+        412: {"description": "Request changed since the given ETag"},
     },
 )
 async def update_request(
     request_id: str,
     request_update: RequestUpdate,
+    http_request: Request,
+    response: Response,
     app: FastAPI = Depends(get_app),
     current_user: UserInToken = Depends(get_current_user),
 ):
@@ -70,12 +77,26 @@ async def update_request(
             detail="Only admins can update the status of a request.",
         )
 
+    query_filter = {"_id": object_id}
+    if has_if_match(http_request):
+        check_if_match(
+            http_request, timestamp_etag(object_id, existing_request["updated_at"])
+        )
+        # A concurrent write between the check and the update fails the filter
+        query_filter["updated_at"] = existing_request["updated_at"]
+
     if update_data:
         update_data["updated_at"] = datetime.utcnow()
-        await app.mongodb["requests"].update_one(
-            {"_id": object_id}, {"$set": update_data}
+        result = await app.mongodb["requests"].update_one(
+            query_filter, {"$set": update_data}
         )
+        if result.matched_count == 0:
+            raise HTTPException(
+                status_code=412,
+                detail="Precondition failed: the resource was modified by someone else",
+            )
 
     updated_request = await app.mongodb["requests"].find_one({"_id": object_id})
+    response.headers["ETag"] = timestamp_etag(object_id, updated_request["updated_at"])
     updated_request["id"] = str(updated_request.pop("_id"))
     return RequestResponse(**updated_request)
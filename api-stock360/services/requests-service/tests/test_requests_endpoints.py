@@ -117,7 +117,7 @@ class FakeCollection:
             except Exception:
                 return UpdateResult(0, 0)
         doc = self._data.get(_id)
-        if not doc:
+        if not doc or any(doc.get(k) != v for k, v in query.items() if k != "_id"):
             return UpdateResult(0, 0)
         # only supporting $set
         set_data = update.get("$set", {})
@@ -323,3 +323,37 @@ async def test_create_get_update_delete_request():
         # Confirm deletion
         r = await ac.get(f"/requests/{created_id}", headers=headers)
         assert r.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_request_etags(ac):
+    headers = {"X-API-Key": "testkey"}
+    created_id = await create_sample_request(ac, headers)
+
+    r = await ac.get(f"/requests/{created_id}", headers=headers)
+    etag = r.headers["ETag"]
+    r = await ac.get(
+        f"/requests/{created_id}", headers={**headers, "If-None-Match": etag}
+    )
+    assert r.status_code == 304
+
+    r = await ac.get("/requests/", headers=headers)
+    r = await ac.get(
+        "/requests/", headers={**headers, "If-None-Match": r.headers["ETag"]}
+    )
+    assert r.status_code == 304
+
+    r = await ac.put(
+        f"/requests/{created_id}",
+        json={"description": "First"},
+        headers={**headers, "If-Match": etag},
+    )
+    assert r.status_code == 200
+    r = await ac.put(
+        f"/requests/{created_id}",
+        json={"description": "Second"},
+        headers={**headers, "If-Match": etag},
+    )
+    assert r.status_code == 412
+    stored = await app.mongodb.requests.find_one({"_id": ObjectId(created_id)})
+    assert stored["description"] == "First"
@@ -0,0 +1,78 @@
+"""Compare per-request bearer-token auth overhead with and without the
+verified-claims cache in tools_app.security.
+
+Calls ``get_current_admin`` directly (no ASGI stack) so the numbers isolate
+token verification. ``tokens`` distinct users are cycled through to show the
+effect of the working set on hit rate. Run from the service folder:
+
+    python benchmarks/bench_jwt_cache.py [requests] [tokens]
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
+
+SERVICE_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(SERVICE_ROOT))
+
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from tools_app import security  # noqa: E402
+from tools_app.routes.tools import utils  # noqa: E402
+
+
+def build_tokens(count: int) -> list[HTTPAuthorizationCredentials]:
+    exp = int(time.time()) + 3600
+    return [
+        HTTPAuthorizationCredentials(
+            scheme="Bearer",
+            credentials=jwt.encode(
+                {"sub": f"user{i}@stock360.pt", "role": "admin", "exp": exp},
+                security.SECRET_KEY,
+                algorithm=security.ALGORITHM,
+            ),
+        )
+        for i in range(count)
+    ]
+
+
+def drive(tokens: list[HTTPAuthorizationCredentials], requests: int) -> float:
+    # warm up imports and, for the cached run, the cache itself
+    for token in tokens:
+        utils.get_current_admin(token=token, api_key=None)
+
+    start = time.perf_counter()
+    for i in range(requests):
+        utils.get_current_admin(token=tokens[i % len(tokens)], api_key=None)
+    return (time.perf_counter() - start) / requests
+
+
+def main(requests: int, token_count: int):
+    tokens = build_tokens(token_count)
+
+    security.token_cache.clear()
+    cached = drive(tokens, requests)
+
+    # what every request paid before: a full signature check and claims parse
+    utils.decode_token = security.verify_token
+    try:
+        uncached = drive(tokens, requests)
+    finally:
+        utils.decode_token = security.decode_token
+
+    print(f"{'verification':<14} {'us/request':>11}")
+    print(f"{'uncached':<14} {uncached * 1e6:>11.1f}")
+    print(f"{'cached':<14} {cached * 1e6:>11.1f}")
+    print(f"speedup: {uncached / cached:.1f}x over {token_count} token(s)")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 100,
+    )
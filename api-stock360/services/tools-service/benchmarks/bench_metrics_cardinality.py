@@ -0,0 +1,61 @@
+"""Show that /metrics stays the same size as distinct item IDs grow.
+
+Run from the service folder:
+
+    python benchmarks/bench_metrics_cardinality.py
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+from bson import ObjectId
+from httpx import ASGITransport, AsyncClient
+
+SERVICE_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(SERVICE_ROOT))
+
+os.environ.setdefault("TOOLS_API_KEY", "benchkey")
+
+from tools_app.main import app  # noqa: E402
+
+CHECKPOINTS = [10, 100, 1000, 5000]
+
+
+class EmptyCollection:
+    async def find_one(self, query):
+        return None
+
+
+class EmptyDB:
+    def __getitem__(self, name):
+        return EmptyCollection()
+
+
+async def main():
+    app.mongodb = EmptyDB()
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://bench",
+        follow_redirects=True,
+    ) as client:
+        requested = 0
+        print(f"{'distinct ids':>12} {'scrape bytes':>13} {'series':>7}")
+        for checkpoint in CHECKPOINTS:
+            while requested < checkpoint:
+                await client.get(f"/tools/{ObjectId()}")
+                requested += 1
+
+            scrape = (await client.get("/metrics")).text
+            series = sum(
+                1
+                for line in scrape.splitlines()
+                if line.startswith("http_request") and not line.startswith("#")
+            )
+            print(f"{requested:>12} {len(scrape):>13} {series:>7}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
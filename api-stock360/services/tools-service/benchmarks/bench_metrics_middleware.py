@@ -0,0 +1,168 @@
+"""Compare per-request overhead of the old BaseHTTPMiddleware metrics layer
+with the pure ASGI PrometheusMiddleware.
+
+Requests are driven straight through the ASGI interface (no HTTP client or
+server) so the numbers isolate middleware cost. Run from the service folder:
+
+    python benchmarks/bench_metrics_middleware.py [requests]
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+from fastapi import FastAPI
+from prometheus_client import CollectorRegistry, Counter, Histogram
+from starlette.requests import Request
+
+SERVICE_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(SERVICE_ROOT))
+
+from tools_app.metrics import PrometheusMiddleware, get_route_template  # noqa: E402
+
+SERVICE_NAME = "bench-service"
+legacy_registry = CollectorRegistry()
+
+LEGACY_REQUESTS_TOTAL = Counter(
+    "http_requests_total",
+    "Total HTTP Requests",
+    ["method", "endpoint", "status_code", "service"],
+    registry=legacy_registry,
+)
+
+LEGACY_REQUEST_ERRORS_TOTAL = Counter(
+    "http_error_requests_total",
+    "Total HTTP Error Requests",
+    ["method", "endpoint", "status_code", "service"],
+    registry=legacy_registry,
+)
+
+LEGACY_REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP Request Latency",
+    ["method", "endpoint", "service"],
+    buckets=[0.05, 0.1, 0.3, 0.5, 1, 2, 5],
+    registry=legacy_registry,
+)
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str):
+        return {"id": item_id, "name": "Cement Bag", "quantity_on_hand": 10}
+
+    return app
+
+
+def build_legacy_app() -> FastAPI:
+    app = build_app()
+
+    # Same shape as the middleware that used to live in every *_app/main.py
+    @app.middleware("http")
+    async def add_prometheus_metrics(request: Request, call_next):
+        start_time = time.time()
+        method = request.method
+
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+        except Exception as e:
+            status_code = 500
+            endpoint = get_route_template(request.scope)
+            LEGACY_REQUEST_ERRORS_TOTAL.labels(
+                method=method,
+                endpoint=endpoint,
+                status_code=status_code,
+                service=SERVICE_NAME,
+            ).inc()
+            raise e
+        else:
+            endpoint = get_route_template(request.scope)
+            if 400 <= status_code < 600:
+                LEGACY_REQUEST_ERRORS_TOTAL.labels(
+                    method=method,
+                    endpoint=endpoint,
+                    status_code=status_code,
+                    service=SERVICE_NAME,
+                ).inc()
+
+        LEGACY_REQUESTS_TOTAL.labels(
+            method=method,
+            endpoint=endpoint,
+            status_code=status_code,
+            service=SERVICE_NAME,
+        ).inc()
+
+        latency = time.time() - start_time
+        LEGACY_REQUEST_LATENCY.labels(
+            method=method, endpoint=endpoint, service=SERVICE_NAME
+        ).observe(latency)
+
+        return response
+
+    return app
+
+
+def build_asgi_app() -> FastAPI:
+    app = build_app()
+    app.add_middleware(PrometheusMiddleware, service_name=SERVICE_NAME)
+    return app
+
+
+async def drive(app, requests: int) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def scope(i):
+        path = f"/items/{i}"
+        return {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"host", b"bench")],
+            "client": ("127.0.0.1", 1234),
+            "server": ("bench", 80),
+        }
+
+    # warm up routing and label caches
+    for i in range(200):
+        await app(scope(i), receive, send)
+
+    start = time.perf_counter()
+    for i in range(requests):
+        await app(scope(i), receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+async def main(requests: int):
+    results = {}
+    for name, factory in (
+        ("BaseHTTPMiddleware", build_legacy_app),
+        ("PrometheusMiddleware", build_asgi_app),
+        ("no middleware", build_app),
+    ):
+        results[name] = await drive(factory(), requests)
+
+    baseline = results["no middleware"]
+    print(f"{'middleware':<22} {'us/request':>11} {'overhead us':>12}")
+    for name, per_request in results.items():
+        print(
+            f"{name:<22} {per_request * 1e6:>11.1f} "
+            f"{(per_request - baseline) * 1e6:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
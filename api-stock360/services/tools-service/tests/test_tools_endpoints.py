@@ -1,3 +1,4 @@
+import json
 import os
 import sys
 from pathlib import Path
@@ -6,6 +7,7 @@ import pytest_asyncio
 
 # datetime not used in tests; remove import
 from bson import ObjectId
+from pymongo import InsertOne
 
 from httpx import AsyncClient, ASGITransport
 
@@ -18,6 +20,8 @@ os.environ.setdefault("TOOLS_API_KEY", "testkey")
 
 # import app (env var set before import intentionally)
 from tools_app.main import app  # noqa: E402
+from tools_app import db_metrics  # noqa: E402
+from tools_app.database import ensure_indexes, get_client_options  # noqa: E402
 
 
 class InsertResult:
@@ -31,6 +35,11 @@ class UpdateResult:
         self.modified_count = modified_count
 
 
+class BulkWriteResult:
+    def __init__(self, upserted_ids):
+        self.upserted_ids = upserted_ids
+
+
 class DeleteResult:
     def __init__(self, deleted_count=0):
         self.deleted_count = deleted_count
@@ -39,6 +48,18 @@ class DeleteResult:
 class FakeCollection:
     def __init__(self):
         self._data = {}
+        self._indexes = {"_id_": {"key": [("_id", 1)]}}
+
+    async def index_information(self):
+        return dict(self._indexes)
+
+    async def create_indexes(self, indexes):
+        for index in indexes:
+            self._indexes.setdefault(index.document["name"], dict(index.document))
+        return [index.document["name"] for index in indexes]
+
+    async def drop_index(self, name):
+        del self._indexes[name]
 
     async def insert_one(self, doc):
         _id = doc.get("_id") or ObjectId()
@@ -49,7 +70,7 @@ class FakeCollection:
         self._data[_id] = stored
         return InsertResult(_id)
 
-    async def find_one(self, query):
+    async def find_one(self, query, projection=None):
         _id = query.get("_id")
         if _id is None:
             return None
@@ -63,18 +84,37 @@ class FakeCollection:
 
     def _match_filter(self, doc, query):
         for k, v in query.items():
-            if doc.get(k) != v:
+            if k == "$or":
+                if not any(self._match_filter(doc, sub) for sub in v):
+                    return False
+            elif isinstance(v, dict):
+                if "$gt" in v and not doc.get(k) > v["$gt"]:
+                    return False
+                if "$gte" in v and not doc.get(k) >= v["$gte"]:
+                    return False
+            elif doc.get(k) != v:
                 return False
         return True
 
-    def find(self, query=None):
+    def find(self, query=None, projection=None):
         query = query or {}
 
         class AsyncCursor:
             def __init__(self, items):
                 self._items = items
 
-            def sort(self, *_args, **_kwargs):
+            def sort(self, keys, direction=1):
+                if isinstance(keys, str):
+                    keys = [(keys, direction)]
+                for key, key_direction in reversed(keys):
+                    self._items.sort(key=lambda d: d.get(key), reverse=key_direction < 0)
+                return self
+
+            def limit(self, n):
+                self._items = self._items[:n]
+                return self
+
+            def batch_size(self, n):
                 return self
 
             def __aiter__(self):
@@ -90,6 +130,8 @@ class FakeCollection:
         items = []
         for doc in self._data.values():
             if self._match_filter(doc, query):
+                if projection:
+                    doc = {k: v for k, v in doc.items() if k == "_id" or projection.get(k)}
                 items.append(dict(doc))
         return AsyncCursor(items)
 
@@ -101,13 +143,38 @@ class FakeCollection:
             except Exception:
                 return UpdateResult(0, 0)
         doc = self._data.get(_id)
-        if not doc:
+        extra = {k: v for k, v in query.items() if k != "_id"}
+        if not doc or not self._match_filter(doc, extra):
             return UpdateResult(0, 0)
         set_data = update.get("$set", {})
         doc.update(set_data)
         self._data[_id] = doc
         return UpdateResult(1, 1)
 
+    async def bulk_write(self, requests, ordered=True):
+        upserted_ids = {}
+        for index, op in enumerate(requests):
+            if isinstance(op, InsertOne):
+                await self.insert_one(op._doc)
+                continue
+            _id = op._filter["_id"]
+            if _id not in self._data:
+                upserted_ids[index] = _id
+                self._data[_id] = {"_id": _id, **op._doc.get("$setOnInsert", {})}
+            self._data[_id].update(op._doc["$set"])
+        return BulkWriteResult(upserted_ids)
+
+    async def find_one_and_update(
+        self, query, update, projection=None, return_document=False
+    ):
+        for doc in self._data.values():
+            if self._match_filter(doc, query):
+                for k, v in update.get("$inc", {}).items():
+                    doc[k] = doc.get(k, 0) + v
+                doc.update(update.get("$set", {}))
+                return dict(doc)
+        return None
+
     async def delete_one(self, query):
         _id = query.get("_id")
         if isinstance(_id, str):
@@ -124,10 +191,11 @@ class FakeCollection:
 class FakeDB:
     def __init__(self):
         self.inventory = FakeCollection()
+        self.stock_adjustments = FakeCollection()
 
     def __getitem__(self, name):
-        if name == "inventory":
-            return self.inventory
+        if name in ("inventory", "stock_adjustments"):
+            return getattr(self, name)
         raise KeyError(name)
 
 
@@ -189,7 +257,7 @@ async def test_list_and_get_item(ac):
 
     r = await ac.get("/tools/", headers=headers)
     assert r.status_code == 200
-    items = r.json()
+    items = r.json()["items"]
     assert any(
         it.get("id") == str(ObjectId(created_id)) or it.get("id") == created_id
         for it in items
@@ -227,3 +295,433 @@ async def test_delete_item(ac):
 
     r = await ac.get(f"/tools/{created_id}", headers=headers)
     assert r.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_metrics_are_labelled_by_route_template(ac):
+    from prometheus_client import REGISTRY
+
+    ids = [str(ObjectId()) for _ in range(3)]
+    for item_id in ids:
+        r = await ac.get(f"/tools/{item_id}")
+        assert r.status_code == 404
+    await ac.get("/definitely/not/a/route")
+
+    labels = {"method": "GET", "status_code": "404", "service": "tools-service"}
+    assert REGISTRY.get_sample_value(
+        "http_requests_total", {**labels, "endpoint": "/tools/{item_id}"}
+    ) >= 3
+    assert REGISTRY.get_sample_value(
+        "http_requests_total", {**labels, "endpoint": "<unmatched>"}
+    ) >= 1
+    for item_id in ids:
+        assert (
+            REGISTRY.get_sample_value(
+                "http_requests_total", {**labels, "endpoint": f"/tools/{item_id}"}
+            )
+            is None
+        )
+
+
+@pytest.mark.asyncio
+async def test_metrics_middleware_records_sizes_and_in_flight(ac):
+    from prometheus_client import REGISTRY
+
+    labels = {"method": "POST", "endpoint": "/tools/", "service": "tools-service"}
+    before = REGISTRY.get_sample_value("http_request_size_bytes_sum", labels) or 0
+
+    await create_sample_item(ac)
+
+    assert REGISTRY.get_sample_value("http_request_size_bytes_sum", labels) > before
+    assert REGISTRY.get_sample_value("http_response_size_bytes_sum", labels) > 0
+    assert (
+        REGISTRY.get_sample_value(
+            "http_requests_in_progress",
+            {"method": "POST", "service": "tools-service"},
+        )
+        == 0
+    )
+
+
+@pytest.mark.asyncio
+async def test_list_items_pages_with_cursor(ac):
+    headers = {"X-API-Key": "testkey"}
+    for name in ["Sand", "Brick", "Cement", "Brick", "Rebar"]:
+        payload = {"name": name, "unit": "pcs", "quantity_on_hand": 1}
+        r = await ac.post("/tools/", json=payload, headers=headers)
+        assert r.status_code == 201
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        r = await ac.get("/tools/", params=params, headers=headers)
+        assert r.status_code == 200
+        page = r.json()
+        assert len(page["items"]) <= 2
+        seen.extend(page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert [it["name"] for it in seen] == ["Brick", "Brick", "Cement", "Rebar", "Sand"]
+    assert len({it["id"] for it in seen}) == 5
+
+    r = await ac.get("/tools/", params={"cursor": "not-a-cursor"}, headers=headers)
+    assert r.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_export_items_streams_ndjson(ac, monkeypatch):
+    from tools_app.routes.tools import get as get_module
+
+    # force several chunks even for a handful of items
+    monkeypatch.setattr(get_module, "EXPORT_CHUNK_BYTES", 64)
+    headers = {"X-API-Key": "testkey"}
+    for name in ["Brick", "Rebar", "Sand"]:
+        payload = {"name": name, "unit": "pcs", "quantity_on_hand": 3}
+        r = await ac.post("/tools/", json=payload, headers=headers)
+        assert r.status_code == 201
+    created_ids = {str(_id) for _id in app.mongodb.inventory._data}
+    # fields that are not part of an Item stay out of the export
+    for doc in app.mongodb.inventory._data.values():
+        doc["stock_adjustments"] = [{"delta": 1}]
+
+    for accept_encoding, gzipped in (
+        ("identity", False),
+        ("gzip", True),
+        ("deflate, gzip;q=0.5", True),
+        ("gzip;q=0", False),
+        ("*;q=0.1, gzip;q=0", False),
+        ("br, *", True),
+    ):
+        r = await ac.get(
+            "/tools/export",
+            headers={**headers, "Accept-Encoding": accept_encoding},
+        )
+        assert r.status_code == 200
+        assert r.headers["content-type"].startswith("application/x-ndjson")
+        assert (r.headers.get("content-encoding") == "gzip") == gzipped
+        rows = [json.loads(line) for line in r.text.splitlines()]
+        assert {row["id"] for row in rows} == created_ids
+        assert all("created_at" in row for row in rows)
+        assert not any("stock_adjustments" in row for row in rows)
+
+
+@pytest.mark.asyncio
+async def test_adjust_item_stock(ac):
+    headers = {"X-API-Key": "testkey"}
+    created_id = await create_sample_item(ac, headers)  # quantity_on_hand=100
+
+    r = await ac.post(
+        f"/tools/{created_id}/adjust",
+        json={"delta": -30, "reason": "site usage"},
+        headers=headers,
+    )
+    assert r.status_code == 200
+    assert r.json()["quantity_on_hand"] == 70
+
+    r = await ac.post(
+        f"/tools/{created_id}/adjust", json={"delta": 5.5}, headers=headers
+    )
+    assert r.json()["quantity_on_hand"] == 75.5
+
+    r = await ac.post(
+        f"/tools/{created_id}/adjust", json={"delta": -80}, headers=headers
+    )
+    assert r.status_code == 409
+    stored = await app.mongodb.inventory.find_one({"_id": ObjectId(created_id)})
+    assert stored["quantity_on_hand"] == 75.5
+    assert "stock_adjustments" not in stored
+    # rejected adjustments leave no trace in the audit trail
+    trail = app.mongodb.stock_adjustments._data.values()
+    assert [(a["item_id"], a["delta"], a["reason"], a["by"]) for a in trail] == [
+        (ObjectId(created_id), -30, "site usage", "api_key_user"),
+        (ObjectId(created_id), 5.5, None, "api_key_user"),
+    ]
+
+    r = await ac.post(
+        f"/tools/{ObjectId()}/adjust", json={"delta": 1}, headers=headers
+    )
+    assert r.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_bulk_import_json_and_csv(ac):
+    headers = {"X-API-Key": "testkey"}
+    existing_id = await create_sample_item(ac, headers)
+
+    rows = [
+        {"name": "Brick", "unit": "pcs", "quantity_on_hand": 500},
+        {"name": "Bad", "unit": "pcs", "quantity_on_hand": -1},
+        {"id": existing_id, "name": "Cement Bag", "unit": "bags", "quantity_on_hand": 7},
+        {"id": str(ObjectId()), "name": "Lime", "unit": "bags", "quantity_on_hand": 3},
+    ]
+    r = await ac.post("/tools/bulk", json=rows, headers=headers)
+    assert r.status_code == 200
+    body = r.json()
+    assert [res["status"] for res in body["results"]] == [
+        "created",
+        "error",
+        "updated",
+        "created",
+    ]
+    assert (body["created"], body["updated"], body["failed"]) == (2, 1, 1)
+    assert "quantity_on_hand" in body["results"][1]["error"]
+    stored = await app.mongodb.inventory.find_one({"_id": ObjectId(existing_id)})
+    assert stored["quantity_on_hand"] == 7
+
+    csv_body = "name,unit,quantity_on_hand,is_active\nSand,tons,12,false\nGravel,,4,\n"
+    r = await ac.post(
+        "/tools/bulk",
+        content=csv_body,
+        headers={**headers, "Content-Type": "text/csv"},
+    )
+    assert r.status_code == 200
+    body = r.json()
+    assert [res["status"] for res in body["results"]] == ["created", "error"]
+    sand = await app.mongodb.inventory.find_one(
+        {"_id": ObjectId(body["results"][0]["id"])}
+    )
+    assert sand["quantity_on_hand"] == 12 and sand["is_active"] is False
+
+    r = await ac.post("/tools/bulk", json={"name": "x"}, headers=headers)
+    assert r.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_is_idempotent():
+    inventory_indexes = app.mongodb.inventory._indexes
+    inventory_indexes["is_active_category_id_name"] = {"key": [("is_active", 1)]}
+
+    first = await ensure_indexes(app)
+    assert first["inventory"]["built"] == [
+        "is_active_category_id_name_id",
+        "is_active_name_id",
+    ]
+    assert "is_active_category_id_name" not in inventory_indexes
+
+    second = await ensure_indexes(app)
+    assert second["inventory"]["built"] == []
+    assert second["inventory"]["existing"] == first["inventory"]["built"]
+    assert app.state.index_report == second
+
+
+def test_client_options_and_pool_metrics_listener(monkeypatch):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo.monitoring import (
+        ConnectionCheckedInEvent,
+        ConnectionCheckedOutEvent,
+        ConnectionCreatedEvent,
+    )
+
+    monkeypatch.setattr("tools_app.database.MONGO_COMPRESSORS", "zlib")
+    monkeypatch.setattr("tools_app.database.MONGO_WAIT_QUEUE_TIMEOUT_MS", "250")
+    options = get_client_options()
+    assert options["compressors"] == "zlib"
+    assert options["waitQueueTimeoutMS"] == 250
+    client = AsyncIOMotorClient("mongodb://localhost:27017", connect=False, **options)
+    assert client.options.pool_options.max_pool_size == options["maxPoolSize"]
+    client.close()
+
+    from prometheus_client import REGISTRY
+
+    def sample(name, labels=None):
+        return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+    listener = db_metrics.PoolMetricsListener()
+    address = ("mongo", 27017)
+    labels = {"address": "mongo:27017"}
+    wait_before = sample("db_pool_checkout_wait_seconds_sum")
+    size_before = sample("db_pool_connections", labels)
+
+    listener.connection_created(ConnectionCreatedEvent(address, 1))
+    listener.connection_checked_out(ConnectionCheckedOutEvent(address, 1, 0.25))
+    assert sample("db_pool_connections_in_use", labels) == 1
+    listener.connection_checked_in(ConnectionCheckedInEvent(address, 1))
+
+    assert sample("db_pool_connections", labels) == size_before + 1
+    assert sample("db_pool_connections_in_use", labels) == 0
+    assert sample("db_pool_checkout_wait_seconds_sum") - wait_before == 0.25
+
+
+def test_command_listener_records_latency_failures_and_slow_commands(caplog):
+    from datetime import timedelta
+
+    from prometheus_client import REGISTRY
+    from pymongo.monitoring import (
+        CommandFailedEvent,
+        CommandStartedEvent,
+        CommandSucceededEvent,
+    )
+
+    def sample(name, labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    listener = db_metrics.CommandMetricsListener(slow_command_ms=50)
+    address = ("mongo", 27017)
+    find_labels = {"command": "find", "collection": "inventory"}
+    count_before = sample("db_command_duration_seconds_count", find_labels)
+    errors_before = sample("db_connection_errors_total", {"source": "command"})
+
+    listener.started(
+        CommandStartedEvent({"find": "inventory", "filter": {}}, "tools", 1, address, 1)
+    )
+    listener.succeeded(
+        CommandSucceededEvent(
+            timedelta(milliseconds=80),
+            {"ok": 1},
+            "find",
+            1,
+            address,
+            1,
+            database_name="tools",
+        )
+    )
+    assert sample("db_command_duration_seconds_count", find_labels) == count_before + 1
+    assert "Slow Mongo command find on tools.inventory" in caplog.text
+
+    listener.started(
+        CommandStartedEvent({"getMore": 42, "collection": "inventory"}, "tools", 2, address, 2)
+    )
+    listener.failed(
+        CommandFailedEvent(
+            timedelta(milliseconds=1),
+            {"errmsg": "connection reset", "errtype": "AutoReconnect"},
+            "getMore",
+            2,
+            address,
+            2,
+        )
+    )
+    assert (
+        sample(
+            "db_command_failures_total",
+            {"command": "getMore", "collection": "inventory"},
+        )
+        >= 1
+    )
+    assert sample("db_connection_errors_total", {"source": "command"}) == errors_before + 1
+    assert listener._collections == {}
+
+
+@pytest.mark.asyncio
+async def test_conditional_get_and_if_match_update(ac):
+    headers = {"X-API-Key": "testkey"}
+    item_id = await create_sample_item(ac, headers)
+
+    r = await ac.get(f"/tools/{item_id}")
+    etag = r.headers["ETag"]
+    r = await ac.get(f"/tools/{item_id}", headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.content == b""
+
+    r = await ac.get("/tools/", headers=headers)
+    list_etag = r.headers["ETag"]
+    r = await ac.get("/tools/", headers={**headers, "If-None-Match": f"W/{list_etag}"})
+    assert r.status_code == 304
+
+    r = await ac.put(
+        f"/tools/{item_id}", json={"name": "Mallet"}, headers={**headers, "If-Match": etag}
+    )
+    assert r.status_code == 200
+    new_etag = r.headers["ETag"]
+    assert new_etag != etag
+
+    # the old ETag is stale now: no lost update
+    r = await ac.put(
+        f"/tools/{item_id}", json={"name": "Sledge"}, headers={**headers, "If-Match": etag}
+    )
+    assert r.status_code == 412
+    r = await ac.get(f"/tools/{item_id}", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()["name"] == "Mallet"
+    assert r.headers["ETag"] == new_etag
+
+
+@pytest.mark.asyncio
+async def test_jwt_claims_are_cached_until_expiry(ac, monkeypatch):
+    import time
+
+    from jose import jwt
+    from prometheus_client import REGISTRY
+
+    from tools_app import security
+
+    monkeypatch.setattr(security, "SECRET_KEY", "testsecret")
+    monkeypatch.setattr(security, "ALGORITHM", "HS256")
+    security.token_cache.clear()
+    verified = []
+    real_verify = security.verify_token
+
+    def counting_verify(token):
+        verified.append(token)
+        return real_verify(token)
+
+    monkeypatch.setattr(security, "verify_token", counting_verify)
+
+    def sample(result):
+        return REGISTRY.get_sample_value("jwt_cache_requests_total", {"result": result}) or 0
+
+    hits_before, negative_before = sample("hit"), sample("negative_hit")
+    token = jwt.encode(
+        {"sub": "admin@x.pt", "role": "admin", "exp": int(time.time()) + 60},
+        "testsecret",
+        algorithm="HS256",
+    )
+    for _ in range(3):
+        r = await ac.get("/tools/", headers={"Authorization": f"Bearer {token}"})
+        assert r.status_code == 200
+    assert verified == [token]
+    assert sample("hit") == hits_before + 2
+
+    bad = token[:-2] + ("AA" if not token.endswith("AA") else "BB")
+    for _ in range(2):
+        r = await ac.get("/tools/", headers={"Authorization": f"Bearer {bad}"})
+        assert r.status_code == 401
+    assert verified == [token, bad]
+    assert sample("negative_hit") == negative_before + 1
+
+    # entries never outlive the token
+    key = security.TokenCache.key("expired")
+    security.token_cache.set(key, {"sub": "admin@x.pt", "exp": int(time.time()) - 1})
+    assert security.token_cache.get(key) == (False, None)
+
+
+@pytest.mark.asyncio
+async def test_revoked_jti_is_rejected_even_when_cached(ac, monkeypatch):
+    import time
+
+    import httpx
+    from jose import jwt
+
+    from tools_app import security
+
+    monkeypatch.setattr(security, "SECRET_KEY", "testsecret")
+    monkeypatch.setattr(security, "ALGORITHM", "HS256")
+    security.token_cache.clear()
+    revocations = security.RevocationList(url="http://auth/auth/revocations")
+    monkeypatch.setattr(security, "revocation_list", revocations)
+
+    def make_token(jti):
+        claims = {"sub": "a@x.pt", "role": "admin", "jti": jti, "exp": int(time.time()) + 60}
+        return jwt.encode(claims, "testsecret", algorithm="HS256")
+
+    kept, revoked = make_token("b" * 32), make_token("c" * 32)
+    for token in (kept, revoked):
+        r = await ac.get("/tools/", headers={"Authorization": f"Bearer {token}"})
+        assert r.status_code == 200
+
+    def handler(request):
+        return httpx.Response(200, json={"jti": ["d" * 32, "c" * 32, "a" * 32]})
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        await revocations.refresh(client)
+    assert len(revocations) == 3
+
+    r = await ac.get("/tools/", headers={"Authorization": f"Bearer {revoked}"})
+    assert r.status_code == 401
+    r = await ac.get("/tools/", headers={"Authorization": f"Bearer {kept}"})
+    assert r.status_code == 200
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel, Field, confloat
 
@@ -63,6 +63,26 @@ class ItemCreate(BaseModel):
     is_active: bool = True
 
 
+class BulkItemRow(ItemCreate):
+    """One row of a bulk import; rows with an ``id`` upsert that item."""
+
+    id: Optional[str] = None
+
+
+class BulkRowResult(BaseModel):
+    row: int = Field(..., description="Zero-based position of the row in the upload.")
+    status: str = Field(..., description="'created', 'updated' or 'error'.")
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BulkImportResponse(BaseModel):
+    created: int
+    updated: int
+    failed: int
+    results: List[BulkRowResult]
+
+
 class ItemUpdate(BaseModel):
     """Model for partial updates to an existing Item."""
 
@@ -89,3 +109,50 @@ class ItemResponse(BaseModel):
 
     class Config:
         json_encoders = {datetime: lambda dt: dt.isoformat()}
+
+
+# Only the fields ItemResponse needs (_id is always returned)
+ITEM_RESPONSE_PROJECTION = {
+    "name": 1,
+    "unit": 1,
+    "quantity_on_hand": 1,
+    "min_quantity": 1,
+    "is_active": 1,
+    "updated_at": 1,
+}
+
+# Fields of an Item written by GET /tools/export; anything else stored on the
+# document (internal or legacy fields) stays out of the export
+ITEM_EXPORT_PROJECTION = {
+    "name": 1,
+    "description": 1,
+    "unit": 1,
+    "quantity_on_hand": 1,
+    "min_quantity": 1,
+    "category_id": 1,
+    "warehouse_id": 1,
+    "is_active": 1,
+    "created_at": 1,
+    "updated_at": 1,
+}
+
+
+class StockAdjustment(BaseModel):
+    """Signed change applied atomically to an item's quantity_on_hand."""
+
+    delta: float = Field(
+        ...,
+        description="Quantity to add (positive) or remove (negative) from stock.",
+    )
+    reason: Optional[str] = Field(
+        None,
+        description="Why the stock changed (e.g., 'delivery', 'site usage'); "
+        "kept in the stock_adjustments audit trail.",
+    )
+
+
+class ItemPage(BaseModel):
+    """One page of items plus the cursor for the next page (None on the last page)."""
+
+    items: List[ItemResponse]
+    next_cursor: Optional[str] = None
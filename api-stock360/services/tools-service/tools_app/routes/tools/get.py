@@ -1,11 +1,85 @@
-from typing import List, Optional
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import Optional
 from bson import ObjectId
-from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query
-from ...models import ItemResponse, UserInToken
-from ...routes.tools.utils import get_current_admin
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from ...etag import conditional_json_response, is_not_modified, not_modified, timestamp_etag
+from ...models import (
+    ITEM_EXPORT_PROJECTION,
+    ITEM_RESPONSE_PROJECTION,
+    ItemPage,
+    ItemResponse,
+    UserInToken,
+)
+from ...routes.tools.utils import decode_cursor, encode_cursor, get_current_admin
 
 router = APIRouter()
 
+LIST_DEFAULT_LIMIT = int(os.getenv("TOOLS_LIST_DEFAULT_LIMIT", "50"))
+LIST_MAX_LIMIT = int(os.getenv("TOOLS_LIST_MAX_LIMIT", "500"))
+
+EXPORT_BATCH_SIZE = int(os.getenv("TOOLS_EXPORT_BATCH_SIZE", "1000"))
+EXPORT_CHUNK_BYTES = int(os.getenv("TOOLS_EXPORT_CHUNK_BYTES", str(64 * 1024)))
+
+
+def _export_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Whether Accept-Encoding allows gzip, honouring q-values (``gzip;q=0`` refuses it)."""
+    qualities = {}
+    for entry in accept_encoding.lower().split(","):
+        coding, *params = [part.strip() for part in entry.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
+async def _iter_ndjson(items_cursor, gzip: bool):
+    """Yield NDJSON lines grouped in ~EXPORT_CHUNK_BYTES chunks, optionally gzipped."""
+    compressor = zlib.compressobj(wbits=31) if gzip else None
+    lines = []
+    size = 0
+
+    def encode(data: bytes) -> bytes:
+        return compressor.compress(data) if compressor else data
+
+    async for item in items_cursor:
+        item["id"] = str(item.pop("_id"))
+        line = json.dumps(item, default=_export_default, separators=(",", ":"))
+        lines.append(line)
+        size += len(line) + 1
+
+        if size >= EXPORT_CHUNK_BYTES:
+            chunk = encode(("\n".join(lines) + "\n").encode("utf-8"))
+            lines = []
+            size = 0
+            if chunk:
+                yield chunk
+
+    tail = ("\n".join(lines) + "\n").encode("utf-8") if lines else b""
+    if compressor:
+        tail = compressor.compress(tail) + compressor.flush()
+    if tail:
+        yield tail
+
 
 def get_app() -> FastAPI:
     from ...main import app
@@ -13,17 +87,73 @@ def get_app() -> FastAPI:
     return app
 
 
+@router.get(
+    "/export",
+    summary="Export items",
+    description=(
+        "Exporta o inventário completo em NDJSON (um item por linha) em streaming, "
+        "com memória constante independentemente do tamanho do catálogo. "
+        "Comprimido com gzip quando `Accept-Encoding` o aceita (`gzip;q=0` recusa). "
+        "Requer privilégios de administrador."
+    ),
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+async def export_items(
+    request: Request,
+    app: FastAPI = Depends(get_app),
+    current_admin: UserInToken = Depends(get_current_admin),
+    category_id: Optional[str] = Query(None, description="Filter items by category ID"),
+    is_active: Optional[bool] = Query(
+        None, description="Filter by active status (all items when omitted)"
+    ),
+):
+    query_filter = {}
+
+    if category_id:
+        query_filter["category_id"] = category_id
+
+    if is_active is not None:
+        query_filter["is_active"] = is_active
+
+    items_cursor = (
+        app.mongodb["inventory"]
+        .find(query_filter, ITEM_EXPORT_PROJECTION)
+        .batch_size(EXPORT_BATCH_SIZE)
+    )
+
+    gzip = _accepts_gzip(request.headers.get("accept-encoding", ""))
+    headers = {"Vary": "Accept-Encoding"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+
+    return StreamingResponse(
+        _iter_ndjson(items_cursor, gzip),
+        media_type="application/x-ndjson",
+        headers=headers,
+    )
+
+
 @router.get(
     "/{item_id}",
     response_model=ItemResponse,
     summary="Get item",
-    description="Recupera um item do inventário por ID.",
+    description=(
+        "Recupera um item do inventário por ID. Devolve `ETag`; com "
+        "`If-None-Match` igual responde 304 sem corpo."
+    ),
     responses={
+        304: {"description": "Not modified"},
         400: {"description": "Invalid Item ID format"},
         404: {"description": "Item not found"},
     },
 )
-async def get_item(item_id: str, app: FastAPI = Depends(get_app)):
+async def get_item(
+    item_id: str,
+    request: Request,
+    response: Response,
+    app: FastAPI = Depends(get_app),
+):
     try:
         object_id = ObjectId(item_id)
     except Exception:
@@ -33,22 +163,45 @@ async def get_item(item_id: str, app: FastAPI = Depends(get_app)):
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
 
+    etag = timestamp_etag(object_id, item["updated_at"])
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+
     item["id"] = str(item.pop("_id"))
     return ItemResponse(**item)
 
 
 @router.get(
     "/",
-    response_model=List[ItemResponse],
+    response_model=ItemPage,
     summary="List items",
-    description="Lista itens do inventário, com filtros opcionais. Requer privilégios de admin para alguns filtros.",
-    responses={200: {"description": "Lista de itens retornada"}},
+    description=(
+        "Lista itens do inventário ordenados por nome, com filtros opcionais e "
+        "paginação por cursor: passe `next_cursor` da resposta anterior em `cursor` "
+        "para obter a página seguinte. Requer privilégios de admin para alguns filtros. "
+        "Alteração incompatível: a resposta passou de uma lista para "
+        "`{items, next_cursor}` e devolve no máximo `limit` itens (50 por omissão); "
+        "os clientes têm de seguir `next_cursor` para obter o inventário completo."
+    ),
+    responses={
+        200: {"description": "Página de itens retornada"},
+        304: {"description": "Not modified"},
+        400: {"description": "Invalid cursor"},
+    },
 )
 async def list_items(
+    request: Request,
     app: FastAPI = Depends(get_app),
     current_admin: UserInToken = Depends(get_current_admin),
     category_id: Optional[str] = Query(None, description="Filter items by category ID"),
     is_active: Optional[bool] = Query(True, description="Filter by active status"),
+    limit: int = Query(
+        LIST_DEFAULT_LIMIT, ge=1, le=LIST_MAX_LIMIT, description="Page size"
+    ),
+    cursor: Optional[str] = Query(
+        None, description="Opaque cursor returned as `next_cursor` by the previous page"
+    ),
 ):
     query_filter = {}
 
@@ -57,11 +210,32 @@ async def list_items(
 
     query_filter["is_active"] = is_active
 
-    items_cursor = app.mongodb["inventory"].find(query_filter).sort("name", 1)
+    if cursor:
+        after_name, after_id = decode_cursor(cursor)
+        query_filter["$or"] = [
+            {"name": {"$gt": after_name}},
+            {"name": after_name, "_id": {"$gt": after_id}},
+        ]
+
+    # Fetch one extra document to know whether another page exists
+    items_cursor = (
+        app.mongodb["inventory"]
+        .find(query_filter, ITEM_RESPONSE_PROJECTION)
+        .sort([("name", 1), ("_id", 1)])
+        .limit(limit + 1)
+    )
 
     items_list = []
+    last_key = None
+    next_cursor = None
     async for item in items_cursor:
+        if len(items_list) == limit:
+            next_cursor = encode_cursor(*last_key)
+            break
+        last_key = (item["name"], item["_id"])
         item["id"] = str(item.pop("_id"))
         items_list.append(ItemResponse(**item))
 
-    return items_list
+    return conditional_json_response(
+        request, ItemPage(items=items_list, next_cursor=next_cursor)
+    )
@@ -1,11 +1,35 @@
+import csv
+import io
+import json
+import os
 from datetime import datetime
-from fastapi import APIRouter, Depends, FastAPI, HTTPException
+from bson import ObjectId
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
+from pydantic import ValidationError
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 from starlette import status
-from ...models import Item, ItemCreate, UserInToken
+from ...models import (
+    ITEM_RESPONSE_PROJECTION,
+    BulkImportResponse,
+    BulkItemRow,
+    BulkRowResult,
+    Item,
+    ItemCreate,
+    ItemResponse,
+    StockAdjustment,
+    UserInToken,
+)
 from ...routes.tools.utils import get_current_admin
 
 router = APIRouter()
 
+BULK_IMPORT_CHUNK_SIZE = int(os.getenv("TOOLS_BULK_IMPORT_CHUNK_SIZE", "1000"))
+BULK_IMPORT_MAX_ROWS = int(os.getenv("TOOLS_BULK_IMPORT_MAX_ROWS", "100000"))
+# Audit trail of stock adjustments, one document per adjustment; kept out of
+# the item documents so reads and exports don't carry it
+STOCK_ADJUSTMENTS_COLLECTION = "stock_adjustments"
+
 
 def get_app() -> FastAPI:
     from ...main import app
@@ -51,3 +75,227 @@ async def create_item(
         return Item(**created_item)
     else:
         raise HTTPException(status_code=500, detail="Failed to retrieve created item")
+
+
+def _parse_bulk_rows(body: bytes, content_type: str) -> list[dict]:
+    if content_type.startswith("text/csv"):
+        try:
+            reader = csv.DictReader(io.StringIO(body.decode("utf-8-sig")))
+            # empty CSV cells mean "not provided", not an empty string
+            return [
+                {key: value for key, value in row.items() if value not in ("", None)}
+                for row in reader
+            ]
+        except (UnicodeDecodeError, csv.Error) as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid CSV: {exc}")
+
+    try:
+        rows = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of items")
+    return rows
+
+
+def _format_validation_error(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+        for error in exc.errors()
+    )
+
+
+async def _write_chunk(collection, chunk, results) -> None:
+    """Run one unordered bulk_write and record a result per row in ``results``."""
+    try:
+        write_result = await collection.bulk_write(
+            [operation for _, _, operation in chunk], ordered=False
+        )
+        upserted = set(write_result.upserted_ids or {})
+        failed = {}
+    except BulkWriteError as exc:
+        upserted = {entry["index"] for entry in exc.details.get("upserted", [])}
+        failed = {
+            entry["index"]: entry.get("errmsg", "Write failed")
+            for entry in exc.details.get("writeErrors", [])
+        }
+
+    for index, (row_number, item_id, operation) in enumerate(chunk):
+        if index in failed:
+            results[row_number] = BulkRowResult(
+                row=row_number, status="error", id=item_id, error=failed[index]
+            )
+        elif isinstance(operation, InsertOne) or index in upserted:
+            results[row_number] = BulkRowResult(
+                row=row_number, status="created", id=item_id
+            )
+        else:
+            results[row_number] = BulkRowResult(
+                row=row_number, status="updated", id=item_id
+            )
+
+
+@router.post(
+    "/bulk",
+    response_model=BulkImportResponse,
+    summary="Bulk import items",
+    description=(
+        "Importa vários itens de uma vez a partir de um array JSON ou de um CSV "
+        "(`Content-Type: text/csv`, cabeçalho com os campos de ItemCreate). "
+        "Linhas com `id` atualizam (upsert) esse item; as restantes são criadas. "
+        "Todas as linhas são validadas primeiro e escritas com `bulk_write` não "
+        "ordenado em blocos. Devolve o resultado de cada linha. Requer papel de "
+        "administrador."
+    ),
+    responses={
+        400: {"description": "Malformed body or too many rows"},
+        403: {"description": "Access denied"},
+    },
+    # The body is parsed by hand so one bad row does not reject the whole upload
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"type": "array", "items": {"type": "object"}}
+                },
+                "text/csv": {"schema": {"type": "string"}},
+            },
+        }
+    },
+)
+async def bulk_import_items(
+    request: Request,
+    app: FastAPI = Depends(get_app),
+    current_admin: UserInToken = Depends(get_current_admin),
+):
+    if current_admin.role != "admin":
+        raise HTTPException(
+            status_code=403, detail="Access denied. Requires 'admin' role."
+        )
+
+    rows = _parse_bulk_rows(
+        await request.body(), request.headers.get("content-type", "")
+    )
+    if len(rows) > BULK_IMPORT_MAX_ROWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many rows ({len(rows)}); limit is {BULK_IMPORT_MAX_ROWS}.",
+        )
+
+    results: list[BulkRowResult | None] = [None] * len(rows)
+    operations = []
+    current_time = datetime.utcnow()
+
+    for row_number, raw_row in enumerate(rows):
+        try:
+            if not isinstance(raw_row, dict):
+                raise ValueError("Row must be an object")
+            row = BulkItemRow(**raw_row)
+            item_data = row.dict(exclude={"id"})
+            item_data["updated_at"] = current_time
+
+            if row.id:
+                object_id = ObjectId(row.id)
+                operation = UpdateOne(
+                    {"_id": object_id},
+                    {"$set": item_data, "$setOnInsert": {"created_at": current_time}},
+                    upsert=True,
+                )
+            else:
+                object_id = ObjectId()
+                operation = InsertOne(
+                    {**item_data, "_id": object_id, "created_at": current_time}
+                )
+        except ValidationError as exc:
+            results[row_number] = BulkRowResult(
+                row=row_number, status="error", error=_format_validation_error(exc)
+            )
+        except Exception as exc:
+            results[row_number] = BulkRowResult(
+                row=row_number, status="error", error=str(exc) or "Invalid row"
+            )
+        else:
+            operations.append((row_number, str(object_id), operation))
+
+    collection = app.mongodb["inventory"]
+    for start in range(0, len(operations), BULK_IMPORT_CHUNK_SIZE):
+        await _write_chunk(
+            collection, operations[start:start + BULK_IMPORT_CHUNK_SIZE], results
+        )
+
+    return BulkImportResponse(
+        created=sum(1 for r in results if r.status == "created"),
+        updated=sum(1 for r in results if r.status == "updated"),
+        failed=sum(1 for r in results if r.status == "error"),
+        results=results,
+    )
+
+
+@router.post(
+    "/{item_id}/adjust",
+    response_model=ItemResponse,
+    summary="Adjust item stock",
+    description=(
+        "Soma `delta` (positivo ou negativo) a `quantity_on_hand` de forma atómica, "
+        "sem perder atualizações concorrentes. Recusa ajustes que deixariam o stock "
+        "negativo. O ajuste (delta, motivo, autor e data) fica registado na "
+        "coleção `stock_adjustments`. Requer papel de administrador."
+    ),
+    responses={
+        400: {"description": "Invalid Item ID format"},
+        403: {"description": "Access denied"},
+        404: {"description": "Item not found"},
+        409: {"description": "Insufficient stock"},
+    },
+)
+async def adjust_item_stock(
+    item_id: str,
+    adjustment: StockAdjustment,
+    app: FastAPI = Depends(get_app),
+    current_admin: UserInToken = Depends(get_current_admin),
+):
+    if current_admin.role != "admin":
+        raise HTTPException(
+            status_code=403, detail="Access denied. Requires 'admin' role."
+        )
+
+    try:
+        object_id = ObjectId(item_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid Item ID format")
+
+    query_filter = {"_id": object_id}
+    if adjustment.delta < 0:
+        # Guard in the same filter so concurrent withdrawals cannot overdraw
+        query_filter["quantity_on_hand"] = {"$gte": -adjustment.delta}
+
+    now = datetime.utcnow()
+    updated_item = await app.mongodb["inventory"].find_one_and_update(
+        query_filter,
+        {
+            "$inc": {"quantity_on_hand": adjustment.delta},
+            "$set": {"updated_at": now},
+        },
+        projection=ITEM_RESPONSE_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+
+    if not updated_item:
+        exists = await app.mongodb["inventory"].find_one({"_id": object_id}, {"_id": 1})
+        if not exists:
+            raise HTTPException(status_code=404, detail="Item not found")
+        raise HTTPException(status_code=409, detail="Insufficient stock")
+
+    await app.mongodb[STOCK_ADJUSTMENTS_COLLECTION].insert_one(
+        {
+            "item_id": object_id,
+            "delta": adjustment.delta,
+            "reason": adjustment.reason,
+            "by": current_admin.sub,
+            "at": now,
+        }
+    )
+
+    updated_item["id"] = str(updated_item.pop("_id"))
+    return ItemResponse(**updated_item)
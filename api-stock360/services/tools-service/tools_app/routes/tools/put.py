@@ -1,8 +1,9 @@
 from datetime import datetime
 from typing import Any, Dict
 from bson import ObjectId
-from fastapi import APIRouter, Depends, FastAPI, HTTPException
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request, Response
 
+from ...etag import check_if_match, has_if_match, timestamp_etag
 from ...models import ItemUpdate, ItemResponse, UserInToken
 from ...routes.tools.utils import get_current_admin
 
@@ -19,16 +20,22 @@ def get_app() -> FastAPI:
     "/{item_id}",
     response_model=ItemResponse,
     summary="Update item",
-    description="Atualiza um item do inventário. Requer papel de administrador.",
+    description=(
+        "Atualiza um item do inventário. Requer papel de administrador. Com "
+        "`If-Match`, só atualiza se o item não mudou desde esse `ETag` (412 caso contrário)."
+    ),
     responses={
         400: {"description": "Invalid Item ID or no fields"},
         403: {"description": "Access denied"},
         404: {"description": "Item not found"},
+        412: {"description": "Item changed since the given ETag"},
     },
 )
 async def update_item(
     item_id: str,
     updates: ItemUpdate,
+    request: Request,
+    response: Response,
     app: FastAPI = Depends(get_app),
     current_admin: UserInToken = Depends(get_current_admin),
 ):
@@ -47,18 +54,35 @@ async def update_item(
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
 
+    query_filter = {"_id": object_id}
+    if has_if_match(request):
+        current = await app.mongodb["inventory"].find_one(
+            {"_id": object_id}, {"updated_at": 1}
+        )
+        if not current:
+            raise HTTPException(status_code=404, detail="Item not found")
+        check_if_match(request, timestamp_etag(object_id, current["updated_at"]))
+        # A concurrent write between the check and the update fails the filter
+        query_filter["updated_at"] = current["updated_at"]
+
     update_data["updated_at"] = datetime.utcnow()
 
     result = await app.mongodb["inventory"].update_one(
-        {"_id": object_id}, {"$set": update_data}
+        query_filter, {"$set": update_data}
     )
 
     if result.matched_count == 0:
+        if "updated_at" in query_filter:
+            raise HTTPException(
+                status_code=412,
+                detail="Precondition failed: the resource was modified by someone else",
+            )
         raise HTTPException(status_code=404, detail="Item not found")
 
     updated_item = await app.mongodb["inventory"].find_one({"_id": object_id})
 
     if updated_item:
+        response.headers["ETag"] = timestamp_etag(object_id, updated_item["updated_at"])
         updated_item["id"] = str(updated_item.pop("_id"))
         return ItemResponse(**updated_item)
     else:
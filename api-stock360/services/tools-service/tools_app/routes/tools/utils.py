@@ -1,5 +1,10 @@
+import base64
+import json
 import os
 
+from bson import ObjectId
+from bson.errors import InvalidId
+
 from ...security import decode_token
 from fastapi import Depends, HTTPException, Security
 from fastapi.security import APIKeyHeader, HTTPAuthorizationCredentials, HTTPBearer
@@ -38,3 +43,18 @@ def get_current_admin(
         return user_info
 
     raise HTTPException(status_code=401, detail="Not authenticated")
+
+
+def encode_cursor(name: str, object_id: ObjectId) -> str:
+    """Opaque keyset cursor pointing just after the item (name, _id)."""
+    raw = json.dumps([name, str(object_id)], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, ObjectId]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        name, object_id = json.loads(base64.urlsafe_b64decode(padded))
+        return name, ObjectId(object_id)
+    except (ValueError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -1,17 +1,184 @@
+import asyncio
+import bisect
+import hashlib
+import logging
 import os
+import threading
+import time
+from collections import OrderedDict
 
+import httpx
 from jose import JWTError, jwt
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
+JWT_CACHE_MAX_ENTRIES = int(os.getenv("JWT_CACHE_MAX_ENTRIES", "10000"))
+JWT_CACHE_MAX_TTL_SECONDS = float(os.getenv("JWT_CACHE_MAX_TTL_SECONDS", "300"))
+JWT_NEGATIVE_CACHE_TTL_SECONDS = float(
+    os.getenv("JWT_NEGATIVE_CACHE_TTL_SECONDS", "30")
+)
+AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth-service:8000")
+REVOCATION_POLL_INTERVAL = float(os.getenv("REVOCATION_POLL_INTERVAL", "15"))
 
+JWT_CACHE_REQUESTS_TOTAL = Counter(
+    "jwt_cache_requests_total",
+    "Bearer token verifications by cache outcome",
+    ["result"],
+)
 
-def decode_token(token: str):
+JWT_REVOKED_TOTAL = Counter(
+    "jwt_revoked_total",
+    "Bearer tokens rejected because their jti is on the revocation list",
+)
+
+
+class TokenCache:
+    """Bounded LRU of verified claims keyed by the SHA-256 of the token.
+
+    Valid tokens are kept until their ``exp`` (capped at
+    JWT_CACHE_MAX_TTL_SECONDS); tokens that failed verification are
+    remembered for JWT_NEGATIVE_CACHE_TTL_SECONDS so a client retrying a bad
+    token does not pay for the signature check every time. Dependencies run
+    in the threadpool, hence the lock.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = JWT_CACHE_MAX_ENTRIES,
+        max_ttl: float = JWT_CACHE_MAX_TTL_SECONDS,
+        negative_ttl: float = JWT_NEGATIVE_CACHE_TTL_SECONDS,
+    ):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self._entries: OrderedDict[bytes, tuple[float, dict | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, key: bytes) -> tuple[bool, dict | None]:
+        """Return (found, claims); claims is None for a cached rejection."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def set(self, key: bytes, claims: dict | None) -> None:
+        now = time.time()
+        if claims is None:
+            expires_at = now + self.negative_ttl
+        else:
+            expires_at = now + self.max_ttl
+            if isinstance(claims.get("exp"), (int, float)):
+                expires_at = min(expires_at, claims["exp"])
+        if self.max_entries <= 0 or expires_at <= now:
+            return
+        with self._lock:
+            self._entries[key] = (expires_at, claims)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class RevocationList:
+    """Revoked access-token ids, polled from the auth service.
+
+    The ids are kept as a sorted tuple and looked up with bisect, so checking
+    a token is an in-memory operation. Each poll swaps the whole tuple; if the
+    auth service is unreachable the last list is kept, and tokens revoked in
+    the meantime stay usable until the next successful poll or their expiry.
+    """
+
+    def __init__(
+        self,
+        url: str = f"{AUTH_SERVICE_URL}/auth/revocations",
+        poll_interval: float = REVOCATION_POLL_INTERVAL,
+    ):
+        self.url = url
+        self.poll_interval = poll_interval
+        self._jtis: tuple[str, ...] = ()
+
+    def __len__(self) -> int:
+        return len(self._jtis)
+
+    def update(self, jtis) -> None:
+        self._jtis = tuple(sorted(jtis))
+
+    def is_revoked(self, jti: str | None) -> bool:
+        if not jti:
+            return False
+        jtis = self._jtis
+        index = bisect.bisect_left(jtis, jti)
+        return index < len(jtis) and jtis[index] == jti
+
+    async def refresh(self, client: httpx.AsyncClient) -> None:
+        response = await client.get(self.url)
+        response.raise_for_status()
+        self.update(response.json()["jti"])
+
+    async def run(self) -> None:
+        async with httpx.AsyncClient(timeout=5) as client:
+            while True:
+                try:
+                    await self.refresh(client)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    logger.warning("Failed to refresh token revocation list: %s", exc)
+                await asyncio.sleep(self.poll_interval)
+
+
+revocation_list = RevocationList()
+
+
+def start_revocation_poller():
+    return asyncio.create_task(revocation_list.run())
+
+
+def verify_token(token: str):
+    """Check the signature and claims without going through the cache."""
     try:
-        payload = jwt.decode(
+        return jwt.decode(
             token, SECRET_KEY, algorithms=[ALGORITHM], options={"verify_exp": True}
         )
-        return payload
     except JWTError as e:
-        print("JWT decode error:", e)
+        logger.debug("JWT decode error: %s", e)
+        return None
+
+
+def decode_token(token: str):
+    key = TokenCache.key(token)
+    found, claims = token_cache.get(key)
+    if found:
+        JWT_CACHE_REQUESTS_TOTAL.labels(
+            result="hit" if claims is not None else "negative_hit"
+        ).inc()
+    else:
+        JWT_CACHE_REQUESTS_TOTAL.labels(result="miss").inc()
+        claims = verify_token(token)
+        token_cache.set(key, claims)
+
+    if claims is None:
+        return None
+    # checked on cache hits too: revocation can happen after the first use
+    if revocation_list.is_revoked(claims.get("jti")):
+        JWT_REVOKED_TOTAL.inc()
         return None
+    return dict(claims)
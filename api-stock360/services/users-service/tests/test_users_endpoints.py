@@ -1,3 +1,5 @@
+import asyncio
+import json
 import os
 import sys
 from pathlib import Path
@@ -33,13 +35,9 @@ class FakeCollection:
     def __init__(self):
         self._data = {}
 
+    # _id is stored as given, like Mongo: profiles use the auth user id string
     async def insert_one(self, doc):
         _id = doc.get("_id") or ObjectId()
-        if isinstance(_id, str):
-            try:
-                _id = ObjectId(_id)
-            except Exception:
-                pass
         stored = dict(doc)
         stored["_id"] = _id
         self._data[_id] = stored
@@ -49,11 +47,6 @@ class FakeCollection:
         _id = query.get("_id")
         if _id is None:
             return None
-        if isinstance(_id, str):
-            try:
-                _id = ObjectId(_id)
-            except Exception:
-                return None
         doc = self._data.get(_id)
         if doc is None:
             return None
@@ -95,21 +88,27 @@ class FakeCollection:
                 items.append(dict(doc))
         return AsyncCursor(items)
 
-    async def update_one(self, query, update):
+    async def update_one(self, query, update, upsert=False):
         _id = query.get("_id")
-        if isinstance(_id, str):
-            try:
-                _id = ObjectId(_id)
-            except Exception:
-                return UpdateResult(0, 0)
         doc = self._data.get(_id)
-        if not doc:
+        if doc is None and upsert:
+            doc = {"_id": _id}
+        elif not doc or any(doc.get(k) != v for k, v in query.items() if k != "_id"):
             return UpdateResult(0, 0)
         set_data = update.get("$set", {})
         doc.update(set_data)
         self._data[_id] = doc
         return UpdateResult(1, 1)
 
+    async def bulk_write(self, requests, ordered=True):
+        if getattr(self, "fail_bulk_write", False):
+            raise ConnectionError("mongo unavailable")
+        for op in requests:
+            _id = op._filter["_id"]
+            doc = self._data.setdefault(_id, {"_id": _id})
+            doc.update(op._doc.get("$set", {}))
+        self.bulk_calls = getattr(self, "bulk_calls", 0) + 1
+
 
 class FakeDB:
     def __init__(self):
@@ -192,6 +191,130 @@ async def test_update_user(ac):
     r = await ac.put(f"/users/{created_id}", json=update_payload, headers=headers)
     assert r.status_code == 200
     # verify stored value
-    stored = await app.mongodb.users.find_one({"_id": ObjectId(created_id)})
+    stored = await app.mongodb.users.find_one({"_id": created_id})
     assert stored is not None
     assert stored.get("name") == "Updated Name"
+
+
+@pytest.mark.asyncio
+async def test_user_etag_and_if_match(ac):
+    from users_app.messaging import upsert_user_profile
+
+    headers = {"X-API-Key": "testkey"}
+    # profiles created by the user.created consumer keep the auth id as a string
+    created_id = str(ObjectId())
+    await upsert_user_profile(
+        app, {"id": created_id, "name": "Alice", "email": "alice@example.com"}
+    )
+    assert created_id in app.mongodb.users._data
+
+    r = await ac.get(f"/users/{created_id}", headers=headers)
+    etag = r.headers["ETag"]
+    r = await ac.get(f"/users/{created_id}", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 304
+
+    r = await ac.put(
+        f"/users/{created_id}", json={"name": "Carol"}, headers={**headers, "If-Match": etag}
+    )
+    assert r.status_code == 200
+    r = await ac.put(
+        f"/users/{created_id}", json={"name": "Dave"}, headers={**headers, "If-Match": etag}
+    )
+    assert r.status_code == 412
+
+    r = await ac.get(f"/users/{created_id}", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()["name"] == "Carol"
+
+
+class FakeMessage:
+    def __init__(self, payload, retries=0):
+        self.body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.headers = {"x-death": [{"count": retries}]} if retries else {}
+        self.message_id = None
+        self.outcome = None
+
+    async def ack(self):
+        self.outcome = "ack"
+
+    async def nack(self, requeue=True):
+        self.outcome = "requeue" if requeue else "dead-letter"
+
+
+def user_event(name):
+    return {"id": str(ObjectId()), "name": name, "email": f"{name}@example.com"}
+
+
+@pytest.mark.asyncio
+async def test_batch_consumer_coalesces_upserts_and_acks_per_batch():
+    from users_app.messaging import UserCreatedBatcher
+
+    batcher = UserCreatedBatcher(app, batch_size=2, flush_interval=0.01)
+    messages = [FakeMessage(user_event(n)) for n in ("a", "b", "c")]
+    invalid = FakeMessage(b"not json")
+
+    for message in messages + [invalid]:
+        await batcher.add(message)
+    # "c" sits in a partial batch until the flush interval elapses
+    await asyncio.sleep(0.05)
+    await batcher.drain()
+
+    assert [m.outcome for m in messages] == ["ack", "ack", "ack"]
+    assert invalid.outcome == "dead-letter"
+    assert app.mongodb.users.bulk_calls == 2
+    assert len(app.mongodb.users._data) == 3
+
+
+@pytest.mark.asyncio
+async def test_batch_consumer_prefetch_allows_concurrent_batches(monkeypatch):
+    from users_app.messaging import UserCreatedBatcher, batch_prefetch_count
+
+    prefetch = batch_prefetch_count(batch_size=2, max_inflight=3, prefetch=2)
+    assert prefetch == 6
+
+    release = asyncio.Event()
+    writing = []
+    real_bulk_write = app.mongodb.users.bulk_write
+
+    async def slow_bulk_write(requests, ordered=True):
+        writing.append(len(requests))
+        await release.wait()
+        await real_bulk_write(requests, ordered=ordered)
+
+    monkeypatch.setattr(app.mongodb.users, "bulk_write", slow_bulk_write)
+    batcher = UserCreatedBatcher(app, batch_size=2, max_inflight=3)
+    messages = [FakeMessage(user_event(f"u{i}")) for i in range(8)]
+
+    async def deliver():
+        # like the broker: no more deliveries while `prefetch` messages are unacked
+        for index, message in enumerate(messages):
+            while sum(m.outcome is None for m in messages[:index]) >= prefetch:
+                await asyncio.sleep(0.001)
+            await batcher.add(message)
+
+    delivery = asyncio.create_task(deliver())
+    await asyncio.sleep(0.05)
+    assert writing == [2, 2, 2]
+
+    release.set()
+    await delivery
+    await batcher.drain()
+    assert all(m.outcome == "ack" for m in messages)
+    assert len(app.mongodb.users._data) == 8
+
+
+@pytest.mark.asyncio
+async def test_batch_consumer_failed_write_follows_retry_semantics():
+    from users_app.messaging import MAX_RETRIES, UserCreatedBatcher
+
+    app.mongodb.users.fail_bulk_write = True
+    batcher = UserCreatedBatcher(app, batch_size=2)
+    fresh = FakeMessage(user_event("fresh"))
+    exhausted = FakeMessage(user_event("old"), retries=MAX_RETRIES)
+
+    await batcher.add(fresh)
+    await batcher.add(exhausted)
+    await batcher.drain()
+
+    assert fresh.outcome == "requeue"
+    assert exhausted.outcome == "dead-letter"
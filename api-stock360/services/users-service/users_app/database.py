@@ -1,16 +1,67 @@
+import asyncio
+import logging
 import os
 
 from fastapi import FastAPI
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from .db_metrics import DB_POOL_MAX_SIZE, get_event_listeners
+
+logger = logging.getLogger(__name__)
 
 MONGO_URL = os.getenv("DATABASE_URL")
 
+# Client settings; with several replicas per service the total connection
+# count against mongod is replicas * MONGO_MAX_POOL_SIZE.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = os.getenv("MONGO_MAX_IDLE_TIME_MS")
+MONGO_WAIT_QUEUE_TIMEOUT_MS = os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS")
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(
+    os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000")
+)
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "20000"))
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS")
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+MONGO_APP_NAME = os.getenv("MONGO_APP_NAME", "users-service")
+MONGO_PREWARM_CONNECTIONS = int(
+    os.getenv("MONGO_PREWARM_CONNECTIONS", str(MONGO_MIN_POOL_SIZE))
+)
+
+# Indexes every collection needs, created idempotently on startup
+INDEXES = {
+    "users": [IndexModel([("email", ASCENDING)], name="email")],
+}
+
+
+def get_client_options() -> dict:
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "readPreference": MONGO_READ_PREFERENCE,
+        "appname": MONGO_APP_NAME,
+    }
+    if MONGO_MAX_IDLE_TIME_MS:
+        options["maxIdleTimeMS"] = int(MONGO_MAX_IDLE_TIME_MS)
+    if MONGO_WAIT_QUEUE_TIMEOUT_MS:
+        options["waitQueueTimeoutMS"] = int(MONGO_WAIT_QUEUE_TIMEOUT_MS)
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    return options
+
 
 def init_db(app: FastAPI):
     if not MONGO_URL:
         raise ValueError("DATABASE_URL not set")
 
-    client = AsyncIOMotorClient(MONGO_URL)
+    client = AsyncIOMotorClient(
+        MONGO_URL, event_listeners=get_event_listeners(), **get_client_options()
+    )
+    DB_POOL_MAX_SIZE.set(MONGO_MAX_POOL_SIZE)
     app.mongodb_client = client
     db_name = os.getenv("USERS_DB")
     if not db_name:
@@ -20,3 +71,45 @@ def init_db(app: FastAPI):
 
 def close_db(app: FastAPI):
     app.mongodb_client.close()
+
+
+async def warm_pool(app: FastAPI) -> None:
+    """Open connections before serving so the first requests skip the handshake."""
+    connections = max(1, MONGO_PREWARM_CONNECTIONS)
+    await asyncio.gather(
+        *(app.mongodb.command("ping") for _ in range(connections))
+    )
+    logger.info("Mongo pool warmed with %s connection(s)", connections)
+
+
+async def ensure_indexes(app: FastAPI) -> dict:
+    """Create any index from INDEXES that does not exist yet and report what was built."""
+    report = {}
+    for collection_name, indexes in INDEXES.items():
+        collection = app.mongodb[collection_name]
+        existing = set(await collection.index_information())
+        names = [index.document["name"] for index in indexes]
+        try:
+            await collection.create_indexes(indexes)
+        except OperationFailure as exc:
+            # e.g. duplicates blocking a unique index: keep serving, but say so
+            logger.error("Failed to build indexes on %s: %s", collection_name, exc)
+            report[collection_name] = {"built": [], "existing": [], "failed": names}
+            continue
+
+        report[collection_name] = {
+            "built": [name for name in names if name not in existing],
+            "existing": [name for name in names if name in existing],
+            "failed": [],
+        }
+
+    for collection_name, result in report.items():
+        logger.info(
+            "Indexes on %s: built=%s existing=%s failed=%s",
+            collection_name,
+            result["built"],
+            result["existing"],
+            result["failed"],
+        )
+    app.state.index_report = report
+    return report
@@ -5,6 +5,9 @@ import os
 
 import aio_pika
 from aio_pika import ExchangeType
+from prometheus_client import Histogram
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 logger = logging.getLogger(__name__)
 
@@ -13,24 +16,39 @@ EXCHANGE_NAME = os.getenv("USER_EVENTS_EXCHANGE", "user.events")
 ROUTING_KEY_USER_CREATED = os.getenv("USER_CREATED_ROUTING_KEY", "user.created")
 QUEUE_NAME = os.getenv("USER_CREATED_QUEUE", "users-service.user-created")
 MAX_RETRIES = int(os.getenv("USER_CREATED_MAX_RETRIES", "5"))
+# "sequential" handles one message at a time; "batch" coalesces upserts
+CONSUMER_MODE = os.getenv("USER_CREATED_CONSUMER_MODE", "sequential")
+PREFETCH_COUNT = int(os.getenv("USER_CREATED_PREFETCH", "10"))
+BATCH_SIZE = int(os.getenv("USER_CREATED_BATCH_SIZE", "10"))
+BATCH_FLUSH_INTERVAL = float(os.getenv("USER_CREATED_BATCH_FLUSH_INTERVAL", "0.05"))
+MAX_INFLIGHT_BATCHES = int(os.getenv("USER_CREATED_MAX_INFLIGHT_BATCHES", "4"))
 
+BATCH_FLUSH_SIZE = Histogram(
+    "user_created_batch_size",
+    "Number of user.created messages written per bulk_write",
+    buckets=[1, 2, 5, 10, 25, 50, 100, 250],
+)
 
-async def upsert_user_profile(app, payload: dict) -> None:
-    users_col = app.mongodb["users"]
 
+def build_user_profile(payload: dict) -> dict:
     user_id = payload.get("id")
     if not user_id:
         raise ValueError("Missing user id in event")
 
-    doc = {
+    return {
         "_id": user_id,
         "name": payload.get("name"),
         "email": payload.get("email"),
         "role": payload.get("role", "user"),
     }
 
+
+async def upsert_user_profile(app, payload: dict) -> None:
+    users_col = app.mongodb["users"]
+    doc = build_user_profile(payload)
+
     await users_col.update_one(
-        {"_id": user_id},
+        {"_id": doc["_id"]},
         {"$set": doc},
         upsert=True,
     )
@@ -60,26 +78,150 @@ async def _handle_message(app, message: aio_pika.IncomingMessage):
         )
         await message.nack(requeue=False)
 
-    except Exception:
-        retries = get_retry_count(message)
+    except Exception as exc:
+        await _handle_failure(message, exc)
 
-        if retries >= MAX_RETRIES:
+
+async def _handle_failure(message: aio_pika.IncomingMessage, exc: Exception):
+    retries = get_retry_count(message)
+
+    if retries >= MAX_RETRIES:
+        logger.error(
+            "Max retries (%s) reached for message %s. Sending to DLQ.",
+            MAX_RETRIES,
+            message.message_id,
+            exc_info=exc,
+        )
+        await message.nack(requeue=False)
+    else:
+        logger.warning(
+            "Error processing message %s. Retry %s/%s.",
+            message.message_id,
+            retries + 1,
+            MAX_RETRIES,
+            exc_info=exc,
+        )
+        await message.nack(requeue=True)
+
+
+def batch_prefetch_count(
+    batch_size: int = BATCH_SIZE,
+    max_inflight: int = MAX_INFLIGHT_BATCHES,
+    prefetch: int = PREFETCH_COUNT,
+) -> int:
+    """Prefetch needed in batch mode for ``max_inflight`` full batches at once.
+
+    Messages stay unacked until their batch is written, so with a smaller
+    prefetch the broker stops delivering before a second batch can fill.
+    """
+    needed = max(1, batch_size) * max(1, max_inflight)
+    if prefetch >= needed:
+        return prefetch
+    if "USER_CREATED_PREFETCH" in os.environ:
+        logger.warning(
+            "USER_CREATED_PREFETCH=%s is below batch size x max in-flight batches "
+            "(%s x %s); using %s",
+            prefetch,
+            batch_size,
+            max_inflight,
+            needed,
+        )
+    return needed
+
+
+class UserCreatedBatcher:
+    """Coalesces user.created upserts into unordered bulk_write batches.
+
+    A batch is flushed when it reaches ``batch_size`` or ``flush_interval``
+    seconds after its first message, whichever comes first. Up to
+    ``max_inflight`` batches are written concurrently. Messages are acked
+    only after their batch is persisted; failed writes go through the same
+    retry/DLQ path as the sequential consumer.
+    """
+
+    def __init__(
+        self,
+        app,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = BATCH_FLUSH_INTERVAL,
+        max_inflight: int = MAX_INFLIGHT_BATCHES,
+    ):
+        self.app = app
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._pending: list[tuple[aio_pika.IncomingMessage, UpdateOne]] = []
+        self._flush_timer: asyncio.TimerHandle | None = None
+        self._inflight: set[asyncio.Task] = set()
+        self._semaphore = asyncio.Semaphore(max(1, max_inflight))
+
+    async def add(self, message: aio_pika.IncomingMessage) -> None:
+        try:
+            payload = json.loads(message.body.decode("utf-8"))
+            doc = build_user_profile(payload)
+            upsert = UpdateOne({"_id": doc["_id"]}, {"$set": doc}, upsert=True)
+        except json.JSONDecodeError as exc:
             logger.error(
-                "Max retries (%s) reached for message %s. Sending to DLQ.",
-                MAX_RETRIES,
-                message.message_id,
+                "Invalid JSON in user.created message: %s",
+                exc,
                 exc_info=True,
             )
             await message.nack(requeue=False)
-        else:
-            logger.warning(
-                "Error processing message %s. Retry %s/%s.",
-                message.message_id,
-                retries + 1,
-                MAX_RETRIES,
-                exc_info=True,
-            )
-            await message.nack(requeue=True)
+            return
+        except Exception as exc:
+            await _handle_failure(message, exc)
+            return
+
+        self._pending.append((message, upsert))
+
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        elif self._flush_timer is None:
+            loop = asyncio.get_running_loop()
+            self._flush_timer = loop.call_later(self.flush_interval, self.flush)
+
+    def flush(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._write_batch(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def drain(self) -> None:
+        self.flush()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    async def _write_batch(self, batch) -> None:
+        async with self._semaphore:
+            BATCH_FLUSH_SIZE.observe(len(batch))
+            try:
+                await self.app.mongodb["users"].bulk_write(
+                    [upsert for _, upsert in batch], ordered=False
+                )
+            except BulkWriteError as exc:
+                failed = {
+                    error["index"]: error
+                    for error in exc.details.get("writeErrors", [])
+                }
+                for index, (message, _) in enumerate(batch):
+                    if index in failed:
+                        await _handle_failure(
+                            message, ValueError(failed[index].get("errmsg"))
+                        )
+                    else:
+                        await message.ack()
+            except Exception as exc:
+                for message, _ in batch:
+                    await _handle_failure(message, exc)
+            else:
+                for message, _ in batch:
+                    await message.ack()
 
 
 async def connect_with_retry():
@@ -100,7 +242,10 @@ async def consume_user_created(app):
         connection = await connect_with_retry()
         channel = await connection.channel()
 
-        await channel.set_qos(prefetch_count=10)
+        prefetch_count = (
+            batch_prefetch_count() if CONSUMER_MODE == "batch" else PREFETCH_COUNT
+        )
+        await channel.set_qos(prefetch_count=prefetch_count)
 
         exchange = await channel.declare_exchange(
             EXCHANGE_NAME,
@@ -131,11 +276,26 @@ async def consume_user_created(app):
 
         await queue.bind(exchange, ROUTING_KEY_USER_CREATED)
 
-        logger.info("RabbitMQ consumer started successfully, listening on queue: %s", QUEUE_NAME)
+        logger.info(
+            "RabbitMQ consumer started successfully (%s mode, prefetch %s), "
+            "listening on queue: %s",
+            CONSUMER_MODE,
+            prefetch_count,
+            QUEUE_NAME,
+        )
 
-        async with queue.iterator() as queue_iter:
-            async for message in queue_iter:
-                await _handle_message(app, message)
+        if CONSUMER_MODE == "batch":
+            batcher = UserCreatedBatcher(app)
+            try:
+                async with queue.iterator() as queue_iter:
+                    async for message in queue_iter:
+                        await batcher.add(message)
+            finally:
+                await batcher.drain()
+        else:
+            async with queue.iterator() as queue_iter:
+                async for message in queue_iter:
+                    await _handle_message(app, message)
 
         await connection.close()
 
@@ -1,7 +1,8 @@
 from ...models import User, UserInToken
 from ...routes.users.utils import get_current_user
-from fastapi import APIRouter, Depends, FastAPI, HTTPException
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
 from starlette import status
+from ...etag import conditional_json_response
 
 router = APIRouter()
 
@@ -18,15 +19,18 @@ def get_app() -> FastAPI:
     summary="Get user",
     description=(
         "Devolve o perfil do utilizador identificado por `user_id`. "
-        "O utilizador autenticado só pode aceder ao próprio perfil, exceto admin."
+        "O utilizador autenticado só pode aceder ao próprio perfil, exceto admin. "
+        "Devolve `ETag`; com `If-None-Match` igual responde 304 sem corpo."
     ),
     responses={
+        304: {"description": "Not modified"},
         403: {"description": "Forbidden - access other user's profile"},
         404: {"description": "User not found"},
     },
 )
 async def get_user(
     user_id: str,
+    request: Request,
     app: FastAPI = Depends(get_app),
     current_user: UserInToken = Depends(get_current_user),
 ):
@@ -41,4 +45,4 @@ async def get_user(
         raise HTTPException(status_code=404, detail="User not found")
 
     user["id"] = str(user["_id"])
-    return User(**user)
+    return conditional_json_response(request, User(**user))
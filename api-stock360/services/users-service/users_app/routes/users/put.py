@@ -1,6 +1,6 @@
-from bson import ObjectId
-from fastapi import APIRouter, Depends, FastAPI, HTTPException
-from ...models import UserUpdate, UserResponse
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
+from ...etag import check_if_match, content_etag, has_if_match, serialize
+from ...models import User, UserUpdate, UserResponse
 from typing import Dict, Any
 
 router = APIRouter()
@@ -16,34 +16,55 @@ def get_app() -> FastAPI:
     "/{user_id}",
     response_model=UserResponse,
     summary="Update user",
-    description="Atualiza campos de um utilizador existente. Retorna 404 se não encontrado.",
+    description=(
+        "Atualiza campos de um utilizador existente. Retorna 404 se não encontrado. "
+        "Com `If-Match` (o `ETag` de GET /users/{user_id}), só atualiza se o perfil "
+        "não mudou entretanto (412 caso contrário)."
+    ),
     responses={
-        400: {"description": "Invalid User ID format or no fields to update"},
+        400: {"description": "No fields to update"},
         404: {"description": "User not found"},
+        412: {"description": "User changed since the given ETag"},
     },
 )
 async def update_user(
-    user_id: str, updates: UserUpdate, app: FastAPI = Depends(get_app)
+    user_id: str,
+    updates: UserUpdate,
+    request: Request,
+    app: FastAPI = Depends(get_app),
 ):
-    try:
-        object_id = ObjectId(user_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid User ID format")
-
     update_data: Dict[str, Any] = updates.dict(exclude_none=True)
 
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
 
+    # Profiles are keyed by the auth user id string (see GET /users/{user_id})
+    query_filter = {"_id": user_id}
+    if has_if_match(request):
+        current = await app.mongodb["users"].find_one(
+            {"_id": user_id}, {"name": 1, "email": 1}
+        )
+        if not current:
+            raise HTTPException(status_code=404, detail="User not found")
+        current_user = User(id=str(current["_id"]), **current)
+        check_if_match(request, content_etag(serialize(current_user)))
+        # Users have no updated_at; match the fields the ETag was computed from
+        query_filter.update(name=current["name"], email=current["email"])
+
     result = await app.mongodb["users"].update_one(
-        {"_id": object_id}, {"$set": update_data}
+        query_filter, {"$set": update_data}
     )
 
     if result.modified_count == 0 and result.matched_count == 0:
+        if len(query_filter) > 1:
+            raise HTTPException(
+                status_code=412,
+                detail="Precondition failed: the resource was modified by someone else",
+            )
         raise HTTPException(status_code=404, detail="User not found")
 
     updated_user = await app.mongodb["users"].find_one(
-        {"_id": object_id}, {"password": 0}
+        {"_id": user_id}, {"password": 0}
     )
 
     if updated_user:
@@ -1,3 +1,5 @@
+import asyncio
+import json
 import os
 import sys
 from pathlib import Path
@@ -17,6 +19,8 @@ os.environ.setdefault("WAREHOUSES_API_KEY", "testkey")
 # import app (keep env var before import intentionally)
 import warehouses_app.main as main_module  # noqa: E402
 from warehouses_app.main import app  # noqa: E402
+from warehouses_app.cache import response_cache  # noqa: E402
+from warehouses_app.geocoding import geocode_address, geocode_cache  # noqa: E402
 
 
 class InsertResult:
@@ -51,6 +55,10 @@ class FakeCollection:
         self._data[_id] = stored
         return InsertResult(_id)
 
+    async def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            await self.insert_one(doc)
+
     async def find_one(self, query):
         _id = query.get("_id")
         if _id is None:
@@ -59,17 +67,41 @@ class FakeCollection:
             try:
                 _id = ObjectId(_id)
             except Exception:
-                return None
+                pass
         doc = self._data.get(_id)
-        return dict(doc) if doc is not None else None
+        if doc is None or not self._match_filter(doc, query):
+            return None
+        return dict(doc)
+
+    @staticmethod
+    def _get_path(doc, path):
+        for part in path.split("."):
+            if not isinstance(doc, dict):
+                return None
+            doc = doc.get(part)
+        return doc
 
     def _match_filter(self, doc, query):
         for k, v in query.items():
-            if doc.get(k) != v:
+            value = self._get_path(doc, k)
+            if isinstance(v, dict):
+                if "$gt" in v and not (value is not None and value > v["$gt"]):
+                    return False
+                if "$lte" in v and not (value is not None and value <= v["$lte"]):
+                    return False
+                if "$in" in v and value not in v["$in"]:
+                    return False
+                if "$ne" in v and value == v["$ne"]:
+                    return False
+                if "$exists" in v and (value is not None) != v["$exists"]:
+                    return False
+            elif k == "_id":
+                continue
+            elif value != v:
                 return False
         return True
 
-    def find(self, query=None):
+    def find(self, query=None, projection=None):
         query = query or {}
 
         class AsyncCursor:
@@ -79,6 +111,10 @@ class FakeCollection:
             def sort(self, *_args, **_kwargs):
                 return self
 
+            def limit(self, n):
+                self._items = self._items[:n]
+                return self
+
             def __aiter__(self):
                 self._iter = iter(self._items)
                 return self
@@ -95,21 +131,79 @@ class FakeCollection:
                 items.append(dict(doc))
         return AsyncCursor(items)
 
-    async def update_one(self, query, update):
+    def aggregate(self, pipeline):
+        import math
+
+        geo_near, limit = pipeline[0]["$geoNear"], pipeline[1]["$limit"]
+        lon0, lat0 = geo_near["near"]["coordinates"]
+
+        def distance_m(point):
+            lon1, lat1 = point["coordinates"]
+            dlat, dlon = math.radians(lat1 - lat0), math.radians(lon1 - lon0)
+            a = (
+                math.sin(dlat / 2) ** 2
+                + math.cos(math.radians(lat0))
+                * math.cos(math.radians(lat1))
+                * math.sin(dlon / 2) ** 2
+            )
+            return 2 * 6371000 * math.asin(math.sqrt(a))
+
+        items = []
+        for doc in self._data.values():
+            point = self._get_path(doc, geo_near["key"])
+            if point is None:
+                continue
+            distance = distance_m(point)
+            if distance <= geo_near.get("maxDistance", math.inf):
+                items.append({**doc, geo_near["distanceField"]: distance})
+        items.sort(key=lambda d: d[geo_near["distanceField"]])
+
+        async def cursor():
+            for item in items[:limit]:
+                yield item
+
+        return cursor()
+
+    @staticmethod
+    def _apply_update(doc, update):
+        for path, value in update.get("$set", {}).items():
+            *parents, leaf = path.split(".")
+            target = doc
+            for part in parents:
+                target = target.setdefault(part, {})
+            target[leaf] = value
+        for path in update.get("$unset", {}):
+            doc.pop(path, None)
+
+    async def update_one(self, query, update, upsert=False):
         _id = query.get("_id")
-        if isinstance(_id, str):
+        if isinstance(_id, str) and not upsert:
             try:
                 _id = ObjectId(_id)
             except Exception:
                 return UpdateResult(0, 0)
         doc = self._data.get(_id)
+        if doc and not self._match_filter(doc, query):
+            doc = None
+        if not doc and upsert:
+            doc = {"_id": _id}
         if not doc:
             return UpdateResult(0, 0)
-        set_data = update.get("$set", {})
-        doc.update(set_data)
+        self._apply_update(doc, update)
         self._data[_id] = doc
         return UpdateResult(1, 1)
 
+    async def bulk_write(self, requests, ordered=True):
+        for op in requests:
+            await self.update_one(op._filter, op._doc)
+        self.bulk_calls = getattr(self, "bulk_calls", 0) + 1
+
+    async def update_many(self, query, update):
+        matched = [doc for doc in self._data.values() if self._match_filter(doc, query)]
+        for doc in matched:
+            self._apply_update(doc, update)
+        return UpdateResult(len(matched), len(matched))
+
     async def delete_one(self, query):
         _id = query.get("_id")
         if isinstance(_id, str):
@@ -126,10 +220,12 @@ class FakeCollection:
 class FakeDB:
     def __init__(self):
         self.warehouses = FakeCollection()
+        self.geocode_cache = FakeCollection()
+        self.migrations = FakeCollection()
 
     def __getitem__(self, name):
-        if name == "warehouses":
-            return self.warehouses
+        if name in ("warehouses", "geocode_cache", "migrations"):
+            return getattr(self, name)
         raise KeyError(name)
 
 
@@ -145,6 +241,7 @@ def set_fake_db(monkeypatch):
         pass
 
     app.mongodb = fake_db
+    response_cache.clear()
     yield
 
 
@@ -230,3 +327,494 @@ async def test_delete_warehouse(ac):
 
     r = await ac.get(f"/warehouses/{created_id}", headers=headers)
     assert r.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_geocoding_is_cached_and_coalesced(ac, monkeypatch):
+    calls = []
+
+    async def fake_fetch(address):
+        calls.append(address)
+        await asyncio.sleep(0.01)
+        return 38.7, -9.1
+
+    monkeypatch.setattr(geocode_cache, "fetch", fake_fetch)
+    geocode_cache.clear()
+    headers = {"X-API-Key": "testkey"}
+
+    responses = await asyncio.gather(
+        *(
+            ac.post(
+                "/warehouses/",
+                json={"name": f"Depot {i}", "location": {"address": address}},
+                headers=headers,
+            )
+            for i, address in enumerate(["Rua Augusta, Lisboa", "rua augusta  lisboa"])
+        )
+    )
+    assert [r.status_code for r in responses] == [201, 201]
+    assert all(r.json()["location"]["lat"] == 38.7 for r in responses)
+    assert len(calls) == 1
+    assert "rua augusta lisboa" in app.mongodb.geocode_cache._data
+
+    # a fresh replica finds the coordinates in Mongo instead of the provider
+    geocode_cache.clear()
+    r = await ac.post(
+        "/warehouses/",
+        json={"name": "Depot 3", "location": {"address": "RUA AUGUSTA, LISBOA"}},
+        headers=headers,
+    )
+    assert r.status_code == 201
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_geocoding_client_reuses_connection_and_trips_breaker(monkeypatch):
+    import httpx
+    from fastapi import HTTPException
+
+    from warehouses_app.geocoding import CircuitBreaker, GeocodingClient
+
+    monkeypatch.setenv("GEOLOCATION_API_KEY", "stub-key")
+    provider = {"status": 200, "calls": 0}
+
+    def stub(request):
+        provider["calls"] += 1
+        assert request.url.params["api_key"] == "stub-key"
+        if provider["status"] != 200:
+            return httpx.Response(provider["status"])
+        return httpx.Response(200, json=[{"lat": "41.15", "lon": "-8.61"}])
+
+    client = GeocodingClient(
+        url="http://geocoder.local/search",
+        breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.05),
+        transport=httpx.MockTransport(stub),
+    )
+    assert await client.fetch("Porto") == (41.15, -8.61)
+    pooled = client._client
+    assert await client.fetch("Braga") == (41.15, -8.61)
+    assert client._client is pooled
+
+    provider["status"] = 503
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc_info:
+            await client.fetch("Porto")
+        assert exc_info.value.status_code == 502
+    assert client.breaker.state == "open"
+
+    calls_when_opened = provider["calls"]
+    with pytest.raises(HTTPException) as exc_info:
+        await client.fetch("Porto")
+    assert exc_info.value.status_code == 503
+    assert "Retry-After" in exc_info.value.headers
+    assert provider["calls"] == calls_when_opened
+
+    # after the reset timeout a single trial call closes the breaker again
+    await asyncio.sleep(0.06)
+    provider["status"] = 200
+    assert await client.fetch("Porto") == (41.15, -8.61)
+    assert client.breaker.state == "closed"
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_deferred_geocoding_is_resolved_by_worker(ac, monkeypatch):
+    from warehouses_app.geocode_worker import PendingGeocodeWorker
+
+    from fastapi import HTTPException
+
+    async def fake_fetch(address):
+        if address == "Nowhere":
+            raise HTTPException(status_code=400, detail="Address not found")
+        return 40.2, -8.4
+
+    monkeypatch.setattr(geocode_cache, "fetch", fake_fetch)
+    geocode_cache.clear()
+    headers = {"X-API-Key": "testkey"}
+
+    pending = [
+        ("Coimbra", "Rua Larga, Coimbra"),
+        ("Ghost", "Nowhere"),
+        ("Coimbra II", "rua larga coimbra"),
+    ]
+    for name, address in pending:
+        r = await ac.post(
+            "/warehouses/?defer_geocoding=true",
+            json={"name": name, "location": {"address": address}},
+            headers=headers,
+        )
+        assert r.status_code == 201
+        body = r.json()
+        assert body["location"]["geocode_status"] == "pending"
+        assert body["location"]["lat"] is None
+    by_name = {doc["name"]: doc["_id"] for doc in app.mongodb.warehouses._data.values()}
+
+    worker = PendingGeocodeWorker(rate_per_second=1000)
+    acquired = []
+    real_acquire = worker.rate_limiter.acquire
+
+    async def counting_acquire():
+        acquired.append(1)
+        await real_acquire()
+
+    monkeypatch.setattr(worker.rate_limiter, "acquire", counting_acquire)
+    assert await worker.resolve_once(app.mongodb) == 3
+    assert await worker.resolve_once(app.mongodb) == 0
+    # the second Coimbra row is a cache hit and takes no provider slot
+    assert len(acquired) == 2
+
+    resolved = await app.mongodb.warehouses.find_one({"_id": by_name["Coimbra"]})
+    assert resolved["location"]["geocode_status"] == "resolved"
+    assert (resolved["location"]["lat"], resolved["location"]["lon"]) == (40.2, -8.4)
+    assert "geocode_lease_id" not in resolved
+    resolved = await app.mongodb.warehouses.find_one({"_id": by_name["Coimbra II"]})
+    assert resolved["location"]["geocode_status"] == "resolved"
+
+    failed = await app.mongodb.warehouses.find_one({"_id": by_name["Ghost"]})
+    assert failed["location"]["geocode_status"] == "failed"
+    assert failed["location"]["lat"] is None
+
+
+@pytest.mark.asyncio
+async def test_worker_does_not_overwrite_location_updated_while_geocoding(ac, monkeypatch):
+    from warehouses_app.geocode_worker import PendingGeocodeWorker
+
+    headers = {"X-API-Key": "testkey"}
+    r = await ac.post(
+        "/warehouses/?defer_geocoding=true",
+        json={"name": "Moving", "location": {"address": "Rua Velha, Braga"}},
+        headers=headers,
+    )
+    assert r.status_code == 201
+    created_id = str(next(iter(app.mongodb.warehouses._data)))
+
+    async def fetch_while_user_moves_it(address):
+        # the admin sets exact coordinates while the old address is being geocoded
+        r = await ac.put(
+            f"/warehouses/{created_id}",
+            json={"location": {"address": "Rua Nova, Porto", "lat": 41.15, "lon": -8.61}},
+            headers=headers,
+        )
+        assert r.status_code == 200
+        return 41.55, -8.42
+
+    monkeypatch.setattr(geocode_cache, "fetch", fetch_while_user_moves_it)
+    geocode_cache.clear()
+
+    worker = PendingGeocodeWorker(rate_per_second=1000)
+    assert await worker.resolve_once(app.mongodb) == 1
+
+    stored = await app.mongodb.warehouses.find_one({"_id": ObjectId(created_id)})
+    assert (stored["location"]["lat"], stored["location"]["lon"]) == (41.15, -8.61)
+    assert stored["location"]["point"]["coordinates"] == [-8.61, 41.15]
+    assert "geocode_status" not in stored["location"]
+    assert "geocode_lease_id" not in stored
+    assert "geocode_available_at" not in stored
+
+
+@pytest.mark.asyncio
+async def test_address_only_location_update_keeps_a_point(ac, monkeypatch):
+    async def fake_fetch(address):
+        return 41.55, -8.42
+
+    monkeypatch.setattr(geocode_cache, "fetch", fake_fetch)
+    geocode_cache.clear()
+    headers = {"X-API-Key": "testkey"}
+    created_id = await create_sample_warehouse(ac, headers)
+
+    r = await ac.put(
+        f"/warehouses/{created_id}",
+        json={"location": {"address": "Avenida Central, Braga"}},
+        headers=headers,
+    )
+    assert r.status_code == 200
+    stored = await app.mongodb.warehouses.find_one({"_id": ObjectId(created_id)})
+    assert (stored["location"]["lat"], stored["location"]["lon"]) == (41.55, -8.42)
+    assert stored["location"]["point"]["coordinates"] == [-8.42, 41.55]
+
+    r = await ac.put(
+        f"/warehouses/{created_id}?defer_geocoding=true",
+        json={"location": {"address": "Rua do Souto, Braga"}},
+        headers=headers,
+    )
+    assert r.status_code == 200
+    assert r.json()["location"]["geocode_status"] == "pending"
+    stored = await app.mongodb.warehouses.find_one({"_id": ObjectId(created_id)})
+    assert "point" not in stored["location"]
+    assert "geocode_available_at" in stored
+
+    r = await ac.put(
+        f"/warehouses/{created_id}", json={"location": {"lat": 41.5}}, headers=headers
+    )
+    assert r.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_location_point_backfill_runs_once():
+    from warehouses_app.database import backfill_location_points
+
+    legacy_id = ObjectId()
+    app.mongodb.warehouses._data[legacy_id] = {
+        "_id": legacy_id,
+        "name": "Legacy",
+        "location": {"lat": 38.72, "lon": -9.14},
+    }
+
+    assert await backfill_location_points(app) == 1
+    legacy = await app.mongodb.warehouses.find_one({"_id": legacy_id})
+    assert legacy["location"]["point"]["coordinates"] == [-9.14, 38.72]
+
+    # later startups skip the scan entirely
+    del app.mongodb.warehouses._data[legacy_id]["location"]["point"]
+    assert await backfill_location_points(app) == 0
+    assert app.mongodb.warehouses.bulk_calls == 1
+
+
+@pytest.mark.asyncio
+async def test_nearby_warehouses_are_sorted_by_distance(ac):
+    headers = {"X-API-Key": "testkey"}
+    sites = {"Lisboa": (38.72, -9.14), "Porto": (41.15, -8.61), "Faro": (37.02, -7.93)}
+    for name, (lat, lon) in sites.items():
+        r = await ac.post(
+            "/warehouses/",
+            json={"name": name, "location": {"lat": lat, "lon": lon}},
+            headers=headers,
+        )
+        assert r.status_code == 201
+
+    stored = next(iter(app.mongodb.warehouses._data.values()))
+    assert stored["location"]["point"] == {"type": "Point", "coordinates": [-9.14, 38.72]}
+
+    r = await ac.get(
+        "/warehouses/nearby",
+        params={"lat": 38.7, "lon": -9.1, "max_km": 250},
+        headers=headers,
+    )
+    assert r.status_code == 200
+    body = r.json()
+    assert [w["name"] for w in body] == ["Lisboa", "Faro"]
+    assert body[0]["distance_km"] < 5 < body[1]["distance_km"] < 250
+
+    r = await ac.get(
+        "/warehouses/nearby", params={"lat": 91, "lon": 0}, headers=headers
+    )
+    assert r.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_geocodes_concurrently_and_reports_rows(ac, monkeypatch):
+    in_flight = {"now": 0, "max": 0}
+
+    async def fake_fetch(address):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        return 39.0 + len(address) / 100, -8.0
+
+    monkeypatch.setattr(geocode_cache, "fetch", fake_fetch)
+    monkeypatch.setattr(
+        "warehouses_app.routes.warehouses.post._bulk_geocode_limiter.interval", 0
+    )
+    geocode_cache.clear()
+
+    rows = [{"name": f"Site {i}", "location": {"address": f"Rua {i}"}} for i in range(6)]
+    rows.insert(2, {"name": "Fixed", "location": {"lat": 40.0, "lon": -8.5}})
+    rows.insert(4, {"location": {"address": "Rua sem nome"}})
+    rows.extend(["Rua solta", None])
+
+    r = await ac.post("/warehouses/bulk", json=rows, headers={"X-API-Key": "testkey"})
+    assert r.status_code == 200
+    body = r.json()
+    assert (body["created"], body["pending"], body["failed"]) == (7, 0, 3)
+    assert body["results"][4]["status"] == "error"
+    assert "name" in body["results"][4]["error"]
+    assert [row["error"] for row in body["results"][-2:]] == ["Row must be an object"] * 2
+    assert 1 < in_flight["max"] <= 4
+    assert len(app.mongodb.warehouses._data) == 7
+    assert all("point" in doc["location"] for doc in app.mongodb.warehouses._data.values())
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_only_rate_limits_provider_calls(ac, monkeypatch):
+    from warehouses_app.routes.warehouses import post as post_module
+
+    fetched = []
+    acquired = []
+
+    async def fake_fetch(address):
+        fetched.append(address)
+        return 38.7, -9.1
+
+    async def counting_acquire():
+        acquired.append(1)
+
+    monkeypatch.setattr(geocode_cache, "fetch", fake_fetch)
+    monkeypatch.setattr(post_module._bulk_geocode_limiter, "acquire", counting_acquire)
+    geocode_cache.clear()
+
+    # warm the cache through a normal create, which is not throttled
+    await geocode_address(app.mongodb, "Rua Augusta, Lisboa")
+    assert fetched == ["Rua Augusta, Lisboa"]
+
+    rows = [
+        {"name": f"Site {i}", "location": {"address": "rua augusta,  LISBOA"}}
+        for i in range(50)
+    ]
+    r = await ac.post("/warehouses/bulk", json=rows, headers={"X-API-Key": "testkey"})
+    assert r.status_code == 200
+    assert r.json()["created"] == 50
+    assert acquired == []
+    assert len(fetched) == 1
+
+    # a miss still goes through the limiter
+    rows = [{"name": "New site", "location": {"address": "Avenida da Liberdade"}}]
+    r = await ac.post("/warehouses/bulk", json=rows, headers={"X-API-Key": "testkey"})
+    assert r.json()["created"] == 1
+    assert acquired == [1]
+
+
+@pytest.mark.asyncio
+async def test_reads_are_cached_until_a_write_invalidates_them(ac, monkeypatch):
+    from prometheus_client import REGISTRY
+
+    from warehouses_app.cache import invalidation_bus
+
+    published = []
+
+    async def fake_publish(keys):
+        published.append(keys)
+
+    monkeypatch.setattr(invalidation_bus, "publish", fake_publish)
+    headers = {"X-API-Key": "testkey"}
+    created_id = await create_sample_warehouse(ac, headers)
+    hits = {"cache": "item", "result": "hit"}
+    hits_before = REGISTRY.get_sample_value("warehouses_cache_requests_total", hits) or 0
+
+    first = await ac.get(f"/warehouses/{created_id}", headers=headers)
+    # a change that bypasses the API is not seen while the entry is fresh
+    app.mongodb.warehouses._data[ObjectId(created_id)]["name"] = "Renamed in DB"
+    second = await ac.get(f"/warehouses/{created_id}", headers=headers)
+    assert first.content == second.content
+    assert second.json()["name"] == "Central Depot"
+    assert REGISTRY.get_sample_value("warehouses_cache_requests_total", hits) == hits_before + 1
+
+    listed = await ac.get("/warehouses/", headers=headers)
+    assert [w["name"] for w in listed.json()] == ["Renamed in DB"]
+
+    r = await ac.put(
+        f"/warehouses/{created_id}", json={"name": "Via API"}, headers=headers
+    )
+    assert r.status_code == 200
+    assert published[-1] == ["list", f"item:{created_id}"]
+    assert (await ac.get(f"/warehouses/{created_id}", headers=headers)).json()[
+        "name"
+    ] == "Via API"
+    assert [w["name"] for w in (await ac.get("/warehouses/", headers=headers)).json()] == [
+        "Via API"
+    ]
+
+    # another replica's write arrives through the invalidation bus
+    app.mongodb.warehouses._data[ObjectId(created_id)]["name"] = "Remote write"
+
+    class Message:
+        body = json.dumps({"origin": "other-replica", "keys": ["list"]}).encode()
+
+    await invalidation_bus._on_message(Message())
+    assert [w["name"] for w in (await ac.get("/warehouses/", headers=headers)).json()] == [
+        "Remote write"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_invalidation_bus_connects_once_the_broker_is_up(monkeypatch):
+    from warehouses_app import cache as cache_module
+
+    published = []
+
+    class FakeExchange:
+        async def publish(self, message, routing_key):
+            published.append(json.loads(message.body)["keys"])
+
+    class FakeQueue:
+        async def bind(self, exchange):
+            pass
+
+        async def consume(self, callback, no_ack):
+            pass
+
+    class FakeChannel:
+        async def declare_exchange(self, *args, **kwargs):
+            return FakeExchange()
+
+        async def declare_queue(self, *args, **kwargs):
+            return FakeQueue()
+
+    class FakeConnection:
+        async def channel(self):
+            return FakeChannel()
+
+        async def close(self):
+            pass
+
+    attempts = []
+
+    async def connect_robust(url):
+        attempts.append(url)
+        if len(attempts) < 3:
+            raise ConnectionError("broker down")
+        return FakeConnection()
+
+    monkeypatch.setattr(cache_module.aio_pika, "connect_robust", connect_robust)
+    bus = cache_module.CacheInvalidationBus(response_cache)
+    monkeypatch.setattr(cache_module, "invalidation_bus", bus)
+
+    # writes made while the broker is down are only invalidated locally
+    await cache_module.invalidate_warehouses("a")
+    assert published == []
+
+    response_cache.set("list", b"[]", '"etag"', response_cache.generation)
+    await asyncio.wait_for(cache_module.connect_invalidation_bus(retry_seconds=0), 1)
+    assert len(attempts) == 3
+    # entries cached while disconnected may have missed remote invalidations
+    assert response_cache.get("list") is None
+
+    await cache_module.invalidate_warehouses("b")
+    assert published == [["list", "item:b"]]
+
+
+@pytest.mark.asyncio
+async def test_warehouse_etags(ac):
+    headers = {"X-API-Key": "testkey"}
+    created_id = await create_sample_warehouse(ac, headers)
+
+    r = await ac.get(f"/warehouses/{created_id}", headers=headers)
+    etag = r.headers["etag"]
+    # served from the cache with the same tag
+    r = await ac.get(f"/warehouses/{created_id}", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.headers["etag"] == etag
+
+    listed = await ac.get("/warehouses/", headers=headers)
+    r = await ac.get(
+        "/warehouses/", headers={**headers, "If-None-Match": f'W/{listed.headers["etag"]}'}
+    )
+    assert r.status_code == 304
+
+    r = await ac.put(
+        f"/warehouses/{created_id}",
+        json={"name": "Stale"},
+        headers={**headers, "If-Match": '"outdated"'},
+    )
+    assert r.status_code == 412
+    assert r.headers["etag"] == etag
+
+    r = await ac.put(
+        f"/warehouses/{created_id}",
+        json={"name": "Fresh"},
+        headers={**headers, "If-Match": etag},
+    )
+    assert r.status_code == 200
+    r = await ac.get(f"/warehouses/{created_id}", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()["name"] == "Fresh"
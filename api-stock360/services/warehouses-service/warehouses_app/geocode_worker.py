@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi import HTTPException
+from prometheus_client import Counter, Gauge
+
+from .cache import invalidate_warehouses
+from .geocoding import (
+    RateLimiter,
+    geocode_address,
+    geocode_cache,
+    geocoding_client,
+    geojson_point,
+)
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_PENDING = "pending"
+GEOCODE_RESOLVED = "resolved"
+GEOCODE_FAILED = "failed"
+
+DEFER_GEOCODING = os.getenv("WAREHOUSES_DEFER_GEOCODING", "false").lower() == "true"
+GEOCODE_WORKER_BATCH_SIZE = int(os.getenv("GEOCODE_WORKER_BATCH_SIZE", "20"))
+GEOCODE_WORKER_POLL_INTERVAL = float(os.getenv("GEOCODE_WORKER_POLL_INTERVAL", "5"))
+GEOCODE_WORKER_RATE_PER_SECOND = float(os.getenv("GEOCODE_WORKER_RATE_PER_SECOND", "1"))
+GEOCODE_WORKER_LEASE_SECONDS = float(os.getenv("GEOCODE_WORKER_LEASE_SECONDS", "120"))
+GEOCODE_WORKER_MAX_ATTEMPTS = int(os.getenv("GEOCODE_WORKER_MAX_ATTEMPTS", "5"))
+GEOCODE_WORKER_RETRY_BASE_SECONDS = float(
+    os.getenv("GEOCODE_WORKER_RETRY_BASE_SECONDS", "30")
+)
+
+# bookkeeping fields removed once a job is resolved (or its location replaced)
+GEOCODE_JOB_FIELDS = {
+    "geocode_available_at": "",
+    "geocode_lease_id": "",
+    "geocode_attempts": "",
+    "geocode_last_error": "",
+}
+
+DEFERRED_GEOCODES_TOTAL = Counter(
+    "deferred_geocodes_total",
+    "Deferred warehouse geocoding jobs by outcome",
+    ["outcome"],
+)
+
+DEFERRED_GEOCODES_PENDING = Gauge(
+    "deferred_geocodes_pending",
+    "Warehouses claimed by the last geocoding batch",
+)
+
+
+class PendingGeocodeWorker:
+    """Resolves coordinates for warehouses stored with ``geocode_status = pending``.
+
+    Works like the auth outbox relay: a batch is claimed by pushing
+    ``geocode_available_at`` past a lease deadline, so several replicas can
+    run the worker and a crashed replica's batch is picked up again once the
+    lease expires. Provider calls are spaced by a shared rate limiter.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = GEOCODE_WORKER_BATCH_SIZE,
+        poll_interval: float = GEOCODE_WORKER_POLL_INTERVAL,
+        rate_per_second: float = GEOCODE_WORKER_RATE_PER_SECOND,
+    ):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.rate_limiter = RateLimiter(rate_per_second)
+        self._wakeup: asyncio.Event | None = None
+
+    def notify(self) -> None:
+        """Wake the worker right away instead of waiting for the next poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def claim_batch(self, collection) -> list[dict]:
+        now = datetime.utcnow()
+        query = {
+            "location.geocode_status": GEOCODE_PENDING,
+            "geocode_available_at": {"$lte": now},
+        }
+        cursor = (
+            collection.find(query, {"_id": 1})
+            .sort("geocode_available_at", 1)
+            .limit(self.batch_size)
+        )
+        candidate_ids = [doc["_id"] async for doc in cursor]
+        if not candidate_ids:
+            return []
+
+        lease_id = str(ObjectId())
+        await collection.update_many(
+            {"_id": {"$in": candidate_ids}, **query},
+            {
+                "$set": {
+                    "geocode_available_at": now
+                    + timedelta(seconds=GEOCODE_WORKER_LEASE_SECONDS),
+                    "geocode_lease_id": lease_id,
+                }
+            },
+        )
+        return [
+            doc
+            async for doc in collection.find(
+                {"_id": {"$in": candidate_ids}, "geocode_lease_id": lease_id}
+            )
+        ]
+
+    async def _provider_fetch(self, address: str) -> tuple[float, float]:
+        # cached addresses resolve immediately; only provider calls are paced
+        await self.rate_limiter.acquire()
+        return await geocode_cache.fetch(address)
+
+    @staticmethod
+    def _job_filter(warehouse: dict) -> dict:
+        # a PUT that replaces the location clears geocode_status, so a result
+        # for the old address can no longer match
+        return {
+            "_id": warehouse["_id"],
+            "geocode_lease_id": warehouse["geocode_lease_id"],
+            "location.geocode_status": GEOCODE_PENDING,
+        }
+
+    async def resolve_once(self, db) -> int:
+        collection = db["warehouses"]
+        batch = await self.claim_batch(collection)
+        DEFERRED_GEOCODES_PENDING.set(len(batch))
+
+        for warehouse in batch:
+            address = warehouse["location"].get("address")
+            try:
+                lat, lon = await geocode_address(db, address, fetch=self._provider_fetch)
+            except HTTPException as exc:
+                await self._handle_failure(collection, warehouse, exc)
+                continue
+
+            result = await collection.update_one(
+                self._job_filter(warehouse),
+                {
+                    "$set": {
+                        "location.lat": lat,
+                        "location.lon": lon,
+                        "location.point": geojson_point(lat, lon),
+                        "location.geocode_status": GEOCODE_RESOLVED,
+                        "updated_at": datetime.utcnow(),
+                    },
+                    "$unset": GEOCODE_JOB_FIELDS,
+                },
+            )
+            if result.matched_count == 0:
+                # location replaced (or lease lost) while geocoding: drop the result
+                DEFERRED_GEOCODES_TOTAL.labels(outcome="superseded").inc()
+                continue
+            await invalidate_warehouses(str(warehouse["_id"]))
+            DEFERRED_GEOCODES_TOTAL.labels(outcome=GEOCODE_RESOLVED).inc()
+
+        DEFERRED_GEOCODES_PENDING.set(0)
+        return len(batch)
+
+    async def _handle_failure(self, collection, warehouse: dict, exc: HTTPException):
+        attempts = warehouse.get("geocode_attempts", 0) + 1
+        query = self._job_filter(warehouse)
+
+        # unknown addresses won't resolve on retry; neither will exhausted jobs
+        if exc.status_code == 400 or attempts >= GEOCODE_WORKER_MAX_ATTEMPTS:
+            logger.warning(
+                "Giving up geocoding warehouse %s: %s", warehouse["_id"], exc.detail
+            )
+            await collection.update_one(
+                query,
+                {
+                    "$set": {
+                        "location.geocode_status": GEOCODE_FAILED,
+                        "geocode_last_error": str(exc.detail),
+                        "updated_at": datetime.utcnow(),
+                    },
+                    "$unset": {"geocode_available_at": "", "geocode_lease_id": ""},
+                },
+            )
+            await invalidate_warehouses(str(warehouse["_id"]))
+            DEFERRED_GEOCODES_TOTAL.labels(outcome=GEOCODE_FAILED).inc()
+            return
+
+        if exc.status_code == 503:
+            # breaker open: wait it out without spending an attempt
+            attempts -= 1
+            delay = max(geocoding_client.breaker.retry_after, self.poll_interval)
+        else:
+            delay = GEOCODE_WORKER_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+
+        await collection.update_one(
+            query,
+            {
+                "$set": {
+                    "geocode_attempts": attempts,
+                    "geocode_available_at": datetime.utcnow() + timedelta(seconds=delay),
+                    "geocode_last_error": str(exc.detail),
+                },
+                "$unset": {"geocode_lease_id": ""},
+            },
+        )
+        DEFERRED_GEOCODES_TOTAL.labels(outcome="retried").inc()
+
+    async def run(self, app) -> None:
+        self._wakeup = asyncio.Event()
+        logger.info("Deferred geocoding worker started")
+
+        while True:
+            try:
+                resolved = await self.resolve_once(app.mongodb)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.error("Geocoding worker iteration failed: %s", exc, exc_info=True)
+                resolved = 0
+
+            if resolved >= self.batch_size:
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+geocode_worker = PendingGeocodeWorker()
+
+
+def mark_pending(warehouse_data: dict) -> None:
+    """Store the warehouse without coordinates and let the worker resolve them."""
+    warehouse_data["location"]["geocode_status"] = GEOCODE_PENDING
+    warehouse_data["geocode_available_at"] = datetime.utcnow()
+
+
+async def prepare_location(
+    db, warehouse_data: dict, defer_geocoding: bool, geocode=None
+) -> None:
+    """Fill in coordinates (or mark them pending) and the GeoJSON point."""
+    geocode = geocode or geocode_address
+    location = warehouse_data["location"]
+    # managed by the service, never taken from the client
+    location.pop("geocode_status", None)
+    needs_geocoding = location.get("address") and (
+        location.get("lat") is None or location.get("lon") is None
+    )
+
+    if needs_geocoding and defer_geocoding:
+        mark_pending(warehouse_data)
+        return
+    if needs_geocoding:
+        location["lat"], location["lon"] = await geocode(db, location["address"])
+
+    if location.get("lat") is None or location.get("lon") is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Latitude/Longitude required or resolvable from address.",
+        )
+    location["point"] = geojson_point(location["lat"], location["lon"])
+
+
+def start_geocode_worker(app):
+    return asyncio.create_task(geocode_worker.run(app))
@@ -0,0 +1,375 @@
+import asyncio
+import logging
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import httpx
+from fastapi import HTTPException
+from prometheus_client import Counter, Gauge, Histogram
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_CACHE_COLLECTION = os.getenv("GEOCODE_CACHE_COLLECTION", "geocode_cache")
+GEOCODE_CACHE_TTL_SECONDS = int(os.getenv("GEOCODE_CACHE_TTL_SECONDS", str(30 * 86400)))
+GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv("GEOCODE_CACHE_MAX_ENTRIES", "10000"))
+
+GEOCODE_PROVIDER_URL = os.getenv("GEOCODE_PROVIDER_URL", "https://geocode.maps.co/search")
+GEOCODE_TIMEOUT_SECONDS = float(os.getenv("GEOCODE_TIMEOUT_SECONDS", "10"))
+GEOCODE_MAX_CONNECTIONS = int(os.getenv("GEOCODE_MAX_CONNECTIONS", "10"))
+GEOCODE_BREAKER_FAILURE_THRESHOLD = int(os.getenv("GEOCODE_BREAKER_FAILURE_THRESHOLD", "5"))
+GEOCODE_BREAKER_RESET_SECONDS = float(os.getenv("GEOCODE_BREAKER_RESET_SECONDS", "30"))
+
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+GEOCODE_PROVIDER_LATENCY = Histogram(
+    "geocode_provider_duration_seconds",
+    "Latency of calls to the external geocoding provider",
+    ["outcome"],
+    buckets=[0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+)
+
+GEOCODE_CIRCUIT_STATE = Gauge(
+    "geocode_circuit_state",
+    "Geocoding circuit breaker state (0 closed, 1 half-open, 2 open)",
+)
+
+GEOCODE_CIRCUIT_REJECTED_TOTAL = Counter(
+    "geocode_circuit_rejected_total",
+    "Geocoding calls rejected without contacting the provider because the circuit was open",
+)
+
+GEOCODE_LOOKUPS_TOTAL = Counter(
+    "geocode_lookups_total",
+    "Address lookups by where the coordinates came from",
+    ["source"],
+)
+
+
+def normalize_address(address: str) -> str:
+    """Cache key for an address: case, punctuation and spacing are ignored."""
+    return " ".join(re.sub(r"[^\w\s]", " ", address.casefold()).split())
+
+
+def geojson_point(lat: float, lon: float) -> dict:
+    """GeoJSON point stored as ``location.point`` for the 2dsphere index."""
+    return {"type": "Point", "coordinates": [lon, lat]}
+
+
+class RateLimiter:
+    """Spaces out calls so at most ``rate`` of them start per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` failures in a row the breaker opens and calls
+    fail fast for ``reset_timeout`` seconds; then a single trial call is let
+    through (half-open) and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = GEOCODE_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = GEOCODE_BREAKER_RESET_SECONDS,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial_in_flight = False
+        self._set_state("closed")
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        GEOCODE_CIRCUIT_STATE.set(CIRCUIT_STATES[state])
+
+    @property
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def before_call(self) -> None:
+        if self.state == "open":
+            if self.retry_after > 0:
+                GEOCODE_CIRCUIT_REJECTED_TOTAL.inc()
+                raise CircuitOpenError()
+            self._set_state("half_open")
+
+        if self.state == "half_open":
+            if self._trial_in_flight:
+                GEOCODE_CIRCUIT_REJECTED_TOTAL.inc()
+                raise CircuitOpenError()
+            self._trial_in_flight = True
+
+    def release(self) -> None:
+        """Give up a half-open trial that ended without an outcome (e.g. cancelled)."""
+        self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        self._trial_in_flight = False
+        self.failures = 0
+        self.opened_at = None
+        if self.state != "closed":
+            logger.info("Geocoding circuit closed")
+            self._set_state("closed")
+
+    def record_failure(self) -> None:
+        self._trial_in_flight = False
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(
+                    "Geocoding circuit opened after %s failure(s)", self.failures
+                )
+            self.opened_at = time.monotonic()
+            self._set_state("open")
+
+
+class GeocodingClient:
+    """App-scoped client for the geocoding provider.
+
+    Keeps one pooled ``httpx.AsyncClient`` (keep-alive, bounded connections)
+    for the life of the process and guards it with a circuit breaker so an
+    outage costs callers a fast 503 instead of a full timeout each.
+    """
+
+    def __init__(
+        self,
+        url: str = GEOCODE_PROVIDER_URL,
+        timeout: float = GEOCODE_TIMEOUT_SECONDS,
+        max_connections: int = GEOCODE_MAX_CONNECTIONS,
+        breaker: CircuitBreaker | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.url = url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.breaker = breaker or CircuitBreaker()
+        self.transport = transport
+        self._client: httpx.AsyncClient | None = None
+
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                transport=self.transport,
+            )
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def fetch(self, address: str) -> tuple[float, float]:
+        """Call external geocoding API to resolve lat/lon from address."""
+        api_key = os.getenv("GEOLOCATION_API_KEY")
+        if not api_key:
+            raise HTTPException(
+                status_code=500,
+                detail="Geocoding API key not configured (GEOCODE_API_KEY).",
+            )
+
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            raise HTTPException(
+                status_code=503,
+                detail="Geocoding service unavailable, please retry later.",
+                headers={"Retry-After": str(math.ceil(self.breaker.retry_after))},
+            )
+
+        await self.start()
+        params = {"q": address, "api_key": api_key}
+        start_time = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await self._client.get(self.url, params=params)
+            outcome = str(response.status_code)
+            response.raise_for_status()
+            data = response.json()
+        except httpx.HTTPStatusError as exc:
+            # only provider-side trouble should trip the breaker
+            if exc.response.status_code >= 500 or exc.response.status_code == 429:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise HTTPException(
+                status_code=502,
+                detail=f"Geocoding service error: {exc.response.status_code}",
+            ) from exc
+        except (httpx.HTTPError, ValueError) as exc:
+            self.breaker.record_failure()
+            raise HTTPException(
+                status_code=502, detail="Failed to reach geocoding service"
+            ) from exc
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        finally:
+            GEOCODE_PROVIDER_LATENCY.labels(outcome=outcome).observe(
+                time.perf_counter() - start_time
+            )
+
+        self.breaker.record_success()
+
+        if not data:
+            raise HTTPException(
+                status_code=400, detail="Address not found in geocoding service"
+            )
+
+        first = data[0]
+        try:
+            lat = float(first["lat"])
+            lon = float(first["lon"])
+        except (KeyError, ValueError, TypeError) as exc:
+            raise HTTPException(
+                status_code=502, detail="Invalid geocoding response format"
+            ) from exc
+
+        return lat, lon
+
+
+geocoding_client = GeocodingClient()
+
+
+class GeocodeCache:
+    """Two-level geocode cache: an in-process LRU in front of a Mongo collection.
+
+    Entries expire after ``ttl_seconds`` in both levels (Mongo through a TTL
+    index on ``expires_at``). Concurrent lookups of the same normalized
+    address share a single resolution, so a burst of creates for one site
+    costs at most one provider call.
+    """
+
+    def __init__(
+        self,
+        fetch=geocoding_client.fetch,
+        max_entries: int = GEOCODE_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = GEOCODE_CACHE_TTL_SECONDS,
+    ):
+        self.fetch = fetch
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, tuple[float, float]]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def _get_local(self, key: str) -> tuple[float, float] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, coordinates = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return coordinates
+
+    def _set_local(self, key: str, coordinates: tuple[float, float], ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, coordinates)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def lookup(self, db, address: str, fetch=None) -> tuple[float, float]:
+        """Resolve ``address`` from the caches, calling the provider on a miss.
+
+        ``fetch`` replaces ``self.fetch`` for this lookup, e.g. to throttle
+        provider calls without slowing down cache hits.
+        """
+        key = normalize_address(address)
+        coordinates = self._get_local(key)
+        if coordinates is not None:
+            GEOCODE_LOOKUPS_TOTAL.labels(source="memory").inc()
+            return coordinates
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            GEOCODE_LOOKUPS_TOTAL.labels(source="coalesced").inc()
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            coordinates = await self._resolve(db, key, address, fetch or self.fetch)
+        except BaseException as exc:
+            future.set_exception(exc)
+            # nobody else may be waiting; don't warn about an unretrieved exception
+            future.exception()
+            raise
+        else:
+            future.set_result(coordinates)
+        finally:
+            self._inflight.pop(key, None)
+        return coordinates
+
+    async def _resolve(self, db, key: str, address: str, fetch) -> tuple[float, float]:
+        collection = db[GEOCODE_CACHE_COLLECTION]
+        now = datetime.utcnow()
+        try:
+            doc = await collection.find_one({"_id": key, "expires_at": {"$gt": now}})
+        except PyMongoError as exc:
+            logger.warning("Geocode cache read failed for %r: %s", key, exc)
+            doc = None
+
+        if doc is not None:
+            GEOCODE_LOOKUPS_TOTAL.labels(source="mongo").inc()
+            coordinates = (doc["lat"], doc["lon"])
+            self._set_local(key, coordinates, (doc["expires_at"] - now).total_seconds())
+            return coordinates
+
+        GEOCODE_LOOKUPS_TOTAL.labels(source="provider").inc()
+        coordinates = await fetch(address)
+        self._set_local(key, coordinates, self.ttl_seconds)
+        try:
+            await collection.update_one(
+                {"_id": key},
+                {
+                    "$set": {
+                        "lat": coordinates[0],
+                        "lon": coordinates[1],
+                        "address": address,
+                        "expires_at": now + timedelta(seconds=self.ttl_seconds),
+                    }
+                },
+                upsert=True,
+            )
+        except PyMongoError as exc:
+            logger.warning("Geocode cache write failed for %r: %s", key, exc)
+        return coordinates
+
+
+geocode_cache = GeocodeCache()
+
+
+async def geocode_address(db, address: str, fetch=None) -> tuple[float, float]:
+    return await geocode_cache.lookup(db, address, fetch)
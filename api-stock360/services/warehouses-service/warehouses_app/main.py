@@ -1,74 +1,27 @@
-import time
+import asyncio
 
 from fastapi import FastAPI
-from prometheus_client import Counter, Histogram, make_asgi_app
-from starlette.requests import Request
-
-from .database import close_db, init_db
+from prometheus_client import make_asgi_app
+
+from .cache import invalidation_bus, start_invalidation_bus
+from .database import (
+    backfill_location_points,
+    close_db,
+    ensure_indexes,
+    init_db,
+    warm_pool,
+)
+from .geocode_worker import start_geocode_worker
+from .geocoding import geocoding_client
+from .metrics import PrometheusMiddleware
+from .security import start_revocation_poller
 from .routes.warehouses import router as warehouses_router
 
 app = FastAPI(title="Warehouses Service")
 
 SERVICE_NAME = "warehouses-service"
 
-REQUESTS_TOTAL = Counter(
-    "http_requests_total",
-    "Total HTTP Requests",
-    ["method", "endpoint", "status_code", "service"],
-)
-
-REQUEST_ERRORS_TOTAL = Counter(
-    "http_error_requests_total",
-    "Total HTTP Error Requests",
-    ["method", "endpoint", "status_code", "service"],
-)
-
-REQUEST_LATENCY = Histogram(
-    "http_request_duration_seconds",
-    "HTTP Request Latency",
-    ["method", "endpoint", "service"],
-    buckets=[0.05, 0.1, 0.3, 0.5, 1, 2, 5],
-)
-
-
-@app.middleware("http")
-async def add_prometheus_metrics(request: Request, call_next):
-    start_time = time.time()
-    endpoint = request.url.path
-    method = request.method
-
-    try:
-        response = await call_next(request)
-        status_code = response.status_code
-    except Exception as e:
-        status_code = 500
-        REQUEST_ERRORS_TOTAL.labels(
-            method=method,
-            endpoint=endpoint,
-            status_code=status_code,
-            service=SERVICE_NAME,
-        ).inc()
-        raise e
-    else:
-        if 400 <= status_code < 600:
-            REQUEST_ERRORS_TOTAL.labels(
-                method=method,
-                endpoint=endpoint,
-                status_code=status_code,
-                service=SERVICE_NAME,
-            ).inc()
-
-    REQUESTS_TOTAL.labels(
-        method=method, endpoint=endpoint, status_code=status_code, service=SERVICE_NAME
-    ).inc()
-
-    latency = time.time() - start_time
-    REQUEST_LATENCY.labels(
-        method=method, endpoint=endpoint, service=SERVICE_NAME
-    ).observe(latency)
-
-    return response
-
+app.add_middleware(PrometheusMiddleware, service_name=SERVICE_NAME)
 
 metrics_app = make_asgi_app()
 app.mount("/metrics", metrics_app)
@@ -77,10 +30,40 @@ app.mount("/metrics", metrics_app)
 @app.on_event("startup")
 async def startup_event():
     init_db(app)
+    await warm_pool(app)
+    await backfill_location_points(app)
+    await ensure_indexes(app)
+    app.state.revocation_poller = start_revocation_poller()
+    await geocoding_client.start()
+    app.state.geocode_worker = start_geocode_worker(app)
+    app.state.invalidation_bus = start_invalidation_bus()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    poller = getattr(app.state, "revocation_poller", None)
+    if poller:
+        poller.cancel()
+        try:
+            await poller
+        except asyncio.CancelledError:
+            pass
+    worker = getattr(app.state, "geocode_worker", None)
+    if worker:
+        worker.cancel()
+        try:
+            await worker
+        except asyncio.CancelledError:
+            pass
+    bus_task = getattr(app.state, "invalidation_bus", None)
+    if bus_task:
+        bus_task.cancel()
+        try:
+            await bus_task
+        except asyncio.CancelledError:
+            pass
+    await geocoding_client.close()
+    await invalidation_bus.close()
     close_db(app)
 
 
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -17,6 +17,10 @@ class Location(BaseModel):
         None, description="Longitude coordinate (auto-filled from address when missing)."
     )
     address: Optional[str] = Field(None, description="Physical street address.")
+    geocode_status: Optional[str] = Field(
+        None,
+        description="Deferred geocoding state: 'pending', 'resolved' or 'failed'.",
+    )
 
 
 class Warehouse(BaseModel):
@@ -62,3 +66,23 @@ class WarehouseResponse(BaseModel):
 
     class Config:
         json_encoders = {datetime: lambda dt: dt.isoformat()}
+
+
+class WarehouseNearby(WarehouseResponse):
+    """Warehouse returned by the nearest-warehouse query."""
+
+    distance_km: float = Field(..., description="Distance from the queried point in km.")
+
+
+class BulkRowResult(BaseModel):
+    row: int = Field(..., description="Zero-based position of the row in the upload.")
+    status: str = Field(..., description="'created', 'pending' or 'error'.")
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BulkImportResponse(BaseModel):
+    created: int
+    pending: int
+    failed: int
+    results: List[BulkRowResult]
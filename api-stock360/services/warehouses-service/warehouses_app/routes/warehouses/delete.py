@@ -2,6 +2,7 @@ from bson import ObjectId
 from fastapi import APIRouter, Depends, FastAPI, HTTPException
 from starlette import status
 
+from ...cache import invalidate_warehouses
 from ...models import UserInToken
 from ...routes.warehouses.utils import get_current_admin
 
@@ -38,5 +39,6 @@ async def delete_warehouse(
 
     if delete_result.deleted_count == 0:
         return
+    await invalidate_warehouses(str(object_id))
 
     return
@@ -1,7 +1,10 @@
-from typing import List
+from typing import List, Optional
 from bson import ObjectId
-from fastapi import APIRouter, Depends, FastAPI, HTTPException
-from ...models import WarehouseResponse, UserInToken
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request
+from ...cache import LIST_KEY, item_key, response_cache
+from ...etag import conditional_json_response, content_etag, etag_json_response, serialize
+from ...geocoding import geojson_point
+from ...models import WarehouseNearby, WarehouseResponse, UserInToken
 from ...routes.warehouses.utils import get_current_admin
 
 router = APIRouter()
@@ -13,6 +16,45 @@ def get_app() -> FastAPI:
     return app
 
 
+@router.get(
+    "/nearby",
+    response_model=List[WarehouseNearby],
+    summary="Nearest warehouses",
+    description="Lista os armazéns mais próximos de um ponto, ordenados por distância. "
+    "Requer privilégios de administrador.",
+    responses={200: {"description": "Armazéns ordenados por distância"}},
+)
+async def nearby_warehouses(
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90, description="Latitude of the point"),
+    lon: float = Query(..., ge=-180, le=180, description="Longitude of the point"),
+    max_km: Optional[float] = Query(
+        None, gt=0, description="Only warehouses within this many km"
+    ),
+    limit: int = Query(10, ge=1, le=100, description="Maximum number of warehouses"),
+    app: FastAPI = Depends(get_app),
+    current_admin: UserInToken = Depends(get_current_admin),
+):
+    geo_near = {
+        "near": geojson_point(lat, lon),
+        "key": "location.point",
+        "distanceField": "distance_m",
+        "spherical": True,
+    }
+    if max_km is not None:
+        geo_near["maxDistance"] = max_km * 1000
+
+    pipeline = [{"$geoNear": geo_near}, {"$limit": limit}]
+
+    warehouses_list = []
+    async for warehouse in app.mongodb["warehouses"].aggregate(pipeline):
+        warehouse["id"] = str(warehouse.pop("_id"))
+        warehouse["distance_km"] = warehouse.pop("distance_m") / 1000
+        warehouses_list.append(WarehouseNearby(**warehouse))
+
+    return conditional_json_response(request, warehouses_list)
+
+
 @router.get(
     "/{warehouse_id}",
     response_model=WarehouseResponse,
@@ -25,6 +67,7 @@ def get_app() -> FastAPI:
 )
 async def get_warehouse(
     warehouse_id: str,
+    request: Request,
     app: FastAPI = Depends(get_app),
     current_admin: UserInToken = Depends(get_current_admin),
 ):
@@ -33,12 +76,21 @@ async def get_warehouse(
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid Warehouse ID format")
 
+    cache_key = item_key(str(object_id))
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return etag_json_response(request, *cached)
+
+    generation = response_cache.generation
     warehouse = await app.mongodb["warehouses"].find_one({"_id": object_id})
     if not warehouse:
         raise HTTPException(status_code=404, detail="Warehouse not found")
 
     warehouse["id"] = str(warehouse.pop("_id"))
-    return WarehouseResponse(**warehouse)
+    body = serialize(WarehouseResponse(**warehouse))
+    etag = content_etag(body)
+    response_cache.set(cache_key, body, etag, generation)
+    return etag_json_response(request, body, etag)
 
 
 @router.get(
@@ -49,9 +101,15 @@ async def get_warehouse(
     responses={200: {"description": "Lista de armazéns retornada"}},
 )
 async def list_warehouses(
+    request: Request,
     app: FastAPI = Depends(get_app),
     current_admin: UserInToken = Depends(get_current_admin),
 ):
+    cached = response_cache.get(LIST_KEY)
+    if cached is not None:
+        return etag_json_response(request, *cached)
+
+    generation = response_cache.generation
     warehouses_cursor = app.mongodb["warehouses"].find().sort("name", 1)
 
     warehouses_list = []
@@ -59,4 +117,7 @@ async def list_warehouses(
         warehouse["id"] = str(warehouse.pop("_id"))
         warehouses_list.append(WarehouseResponse(**warehouse))
 
-    return warehouses_list
+    body = serialize(warehouses_list)
+    etag = content_etag(body)
+    response_cache.set(LIST_KEY, body, etag, generation)
+    return etag_json_response(request, body, etag)
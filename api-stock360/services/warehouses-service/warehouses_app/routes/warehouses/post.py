@@ -1,15 +1,39 @@
+import asyncio
 import os
 from datetime import datetime
+from typing import Any, List
 
-import httpx
-from fastapi import APIRouter, Depends, FastAPI, HTTPException
+from bson import ObjectId
+from fastapi import APIRouter, Body, Depends, FastAPI, HTTPException, Query
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
 from starlette import status
 
-from ...models import Warehouse, WarehouseCreate, UserInToken
+from ...cache import invalidate_warehouses
+from ...geocode_worker import DEFER_GEOCODING, geocode_worker, prepare_location
+from ...geocoding import RateLimiter, geocode_address, geocode_cache
+from ...models import (
+    BulkImportResponse,
+    BulkRowResult,
+    Warehouse,
+    WarehouseCreate,
+    UserInToken,
+)
 from ...routes.warehouses.utils import get_current_admin
 
 router = APIRouter()
 
+BULK_IMPORT_MAX_ROWS = int(os.getenv("WAREHOUSES_BULK_IMPORT_MAX_ROWS", "1000"))
+BULK_GEOCODE_CONCURRENCY = int(os.getenv("WAREHOUSES_BULK_GEOCODE_CONCURRENCY", "4"))
+BULK_GEOCODE_RATE_PER_SECOND = float(
+    os.getenv("WAREHOUSES_BULK_GEOCODE_RATE_PER_SECOND", "2")
+)
+
+# Shared by all bulk imports in the process so parallel uploads can't add up
+# to more than the provider allows
+_bulk_geocode_semaphore = asyncio.Semaphore(BULK_GEOCODE_CONCURRENCY)
+_bulk_geocode_limiter = RateLimiter(BULK_GEOCODE_RATE_PER_SECOND)
+
 
 def get_app() -> FastAPI:
     from ...main import app
@@ -17,49 +41,14 @@ def get_app() -> FastAPI:
     return app
 
 
-async def _geocode_address(address: str) -> tuple[float, float]:
-    """Call external geocoding API to resolve lat/lon from address."""
-    api_key = os.getenv("GEOLOCATION_API_KEY")
-    if not api_key:
-        raise HTTPException(
-            status_code=500, detail="Geocoding API key not configured (GEOCODE_API_KEY)."
-        )
-
-    url = "https://geocode.maps.co/search"
-    params = {"q": address, "api_key": api_key}
-
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-    except httpx.HTTPStatusError as exc:
-        raise HTTPException(
-            status_code=502,
-            detail=f"Geocoding service error: {exc.response.status_code}",
-        ) from exc
-    except httpx.HTTPError as exc:
-        raise HTTPException(status_code=502, detail="Failed to reach geocoding service") from exc
-
-    if not data:
-        raise HTTPException(status_code=400, detail="Address not found in geocoding service")
-
-    first = data[0]
-    try:
-        lat = float(first["lat"])
-        lon = float(first["lon"])
-    except (KeyError, ValueError, TypeError) as exc:
-        raise HTTPException(status_code=502, detail="Invalid geocoding response format") from exc
-
-    return lat, lon
-
-
 @router.post(
     "/",
     response_model=Warehouse,
     status_code=status.HTTP_201_CREATED,
     summary="Create warehouse",
-    description="Cria um novo armazém. Requer privilégios de administrador.",
+    description="Cria um novo armazém. Requer privilégios de administrador. "
+    "Com defer_geocoding, o armazém é guardado de imediato e as coordenadas "
+    "são resolvidas em segundo plano.",
     responses={
         400: {"description": "Validation error"},
         500: {"description": "Failed to retrieve created warehouse"},
@@ -69,30 +58,23 @@ async def create_warehouse(
     warehouse: WarehouseCreate,
     app: FastAPI = Depends(get_app),
     current_admin: UserInToken = Depends(get_current_admin),
+    defer_geocoding: bool = Query(
+        DEFER_GEOCODING,
+        description="Store the warehouse now and resolve lat/lon in the background",
+    ),
 ):
     new_warehouse_data = warehouse.dict()
-
-    location = new_warehouse_data.get("location", {})
-
-    if location.get("address") and (
-        location.get("lat") is None or location.get("lon") is None
-    ):
-        lat, lon = await _geocode_address(location["address"])
-        location["lat"] = lat
-        location["lon"] = lon
-        new_warehouse_data["location"] = location
-
-    if location.get("lat") is None or location.get("lon") is None:
-        raise HTTPException(
-            status_code=400,
-            detail="Latitude/Longitude required or resolvable from address.",
-        )
+    await prepare_location(app.mongodb, new_warehouse_data, defer_geocoding)
+    location = new_warehouse_data["location"]
 
     current_time = datetime.utcnow()
     new_warehouse_data["created_at"] = current_time
     new_warehouse_data["updated_at"] = current_time
 
     insert_result = await app.mongodb["warehouses"].insert_one(new_warehouse_data)
+    await invalidate_warehouses()
+    if location.get("geocode_status"):
+        geocode_worker.notify()
 
     created_warehouse = await app.mongodb["warehouses"].find_one(
         {"_id": insert_result.inserted_id}
@@ -105,3 +87,128 @@ async def create_warehouse(
         raise HTTPException(
             status_code=500, detail="Failed to retrieve created warehouse"
         )
+
+
+async def _bulk_provider_fetch(address: str) -> tuple[float, float]:
+    # Only cache misses reach the provider, so only they are throttled
+    async with _bulk_geocode_semaphore:
+        await _bulk_geocode_limiter.acquire()
+        return await geocode_cache.fetch(address)
+
+
+async def _bulk_geocode(db, address: str) -> tuple[float, float]:
+    return await geocode_address(db, address, fetch=_bulk_provider_fetch)
+
+
+def _format_validation_error(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+        for error in exc.errors()
+    )
+
+
+@router.post(
+    "/bulk",
+    response_model=BulkImportResponse,
+    summary="Bulk create warehouses",
+    description=(
+        "Cria vários armazéns de uma vez. Todas as linhas são validadas, as "
+        "coordenadas em falta são geocodificadas em paralelo (com limite de "
+        "concorrência e de pedidos por segundo, reutilizando a cache) e os "
+        "armazéns válidos são inseridos com um único `insert_many`. Devolve o "
+        "resultado de cada linha. Requer privilégios de administrador."
+    ),
+    responses={400: {"description": "Too many rows"}},
+)
+async def bulk_create_warehouses(
+    # rows are validated one by one, so a malformed row fails alone
+    rows: List[Any] = Body(..., description="Warehouses to create"),
+    app: FastAPI = Depends(get_app),
+    current_admin: UserInToken = Depends(get_current_admin),
+    defer_geocoding: bool = Query(
+        DEFER_GEOCODING,
+        description="Store the warehouses now and resolve lat/lon in the background",
+    ),
+):
+    if len(rows) > BULK_IMPORT_MAX_ROWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many rows ({len(rows)}); limit is {BULK_IMPORT_MAX_ROWS}.",
+        )
+
+    results: list[BulkRowResult | None] = [None] * len(rows)
+    valid_rows = []
+    for row_number, raw_row in enumerate(rows):
+        if not isinstance(raw_row, dict):
+            results[row_number] = BulkRowResult(
+                row=row_number, status="error", error="Row must be an object"
+            )
+            continue
+        try:
+            valid_rows.append((row_number, WarehouseCreate(**raw_row).dict()))
+        except ValidationError as exc:
+            results[row_number] = BulkRowResult(
+                row=row_number, status="error", error=_format_validation_error(exc)
+            )
+
+    outcomes = await asyncio.gather(
+        *(
+            prepare_location(app.mongodb, data, defer_geocoding, geocode=_bulk_geocode)
+            for _, data in valid_rows
+        ),
+        return_exceptions=True,
+    )
+
+    current_time = datetime.utcnow()
+    documents = []
+    for (row_number, data), outcome in zip(valid_rows, outcomes):
+        if isinstance(outcome, BaseException):
+            error = outcome.detail if isinstance(outcome, HTTPException) else str(outcome)
+            results[row_number] = BulkRowResult(
+                row=row_number, status="error", error=error
+            )
+            continue
+        data["_id"] = ObjectId()
+        data["created_at"] = current_time
+        data["updated_at"] = current_time
+        documents.append((row_number, data))
+
+    failed = {}
+    if documents:
+        try:
+            await app.mongodb["warehouses"].insert_many(
+                [data for _, data in documents], ordered=False
+            )
+        except BulkWriteError as exc:
+            failed = {
+                entry["index"]: entry.get("errmsg", "Write failed")
+                for entry in exc.details.get("writeErrors", [])
+            }
+
+    if documents:
+        await invalidate_warehouses()
+
+    for index, (row_number, data) in enumerate(documents):
+        warehouse_id = str(data["_id"])
+        if index in failed:
+            results[row_number] = BulkRowResult(
+                row=row_number, status="error", id=warehouse_id, error=failed[index]
+            )
+        elif data["location"].get("geocode_status"):
+            results[row_number] = BulkRowResult(
+                row=row_number, status="pending", id=warehouse_id
+            )
+        else:
+            results[row_number] = BulkRowResult(
+                row=row_number, status="created", id=warehouse_id
+            )
+
+    if any(r.status == "pending" for r in results):
+        geocode_worker.notify()
+
+    return BulkImportResponse(
+        created=sum(1 for r in results if r.status == "created"),
+        pending=sum(1 for r in results if r.status == "pending"),
+        failed=sum(1 for r in results if r.status == "error"),
+        results=results,
+    )
@@ -2,8 +2,16 @@ from datetime import datetime
 from typing import Any, Dict
 
 from bson import ObjectId
-from fastapi import APIRouter, Depends, FastAPI, HTTPException
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request
 
+from ...cache import invalidate_warehouses
+from ...etag import check_if_match, content_etag, has_if_match, serialize
+from ...geocode_worker import (
+    DEFER_GEOCODING,
+    GEOCODE_JOB_FIELDS,
+    geocode_worker,
+    prepare_location,
+)
 from ...models import WarehouseUpdate, WarehouseResponse, UserInToken
 from ...routes.warehouses.utils import get_current_admin
 
@@ -20,17 +28,28 @@ def get_app() -> FastAPI:
     "/{warehouse_id}",
     response_model=WarehouseResponse,
     summary="Update warehouse",
-    description="Atualiza um armazém existente. Requer privilégios de administrador.",
+    description=(
+        "Atualiza um armazém existente. Requer privilégios de administrador. "
+        "Com `If-Match` (o `ETag` de GET /warehouses/{warehouse_id}), só atualiza "
+        "se o armazém não mudou entretanto (412 caso contrário). Uma localização "
+        "só com morada é geocodificada (ou fica pendente com defer_geocoding)."
+    ),
     responses={
-        400: {"description": "Invalid Warehouse ID format or no fields to update"},
+        400: {"description": "Invalid ID, no fields to update or location without coordinates"},
         404: {"description": "Warehouse not found"},
+        412: {"description": "Warehouse changed since the given ETag"},
     },
 )
 async def update_warehouse(
     warehouse_id: str,
     updates: WarehouseUpdate,
+    request: Request,
     app: FastAPI = Depends(get_app),
     current_admin: UserInToken = Depends(get_current_admin),
+    defer_geocoding: bool = Query(
+        DEFER_GEOCODING,
+        description="Store the new address now and resolve lat/lon in the background",
+    ),
 ):
     try:
         object_id = ObjectId(warehouse_id)
@@ -41,15 +60,42 @@ async def update_warehouse(
 
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
+    if "location" in update_data:
+        # the location is replaced as a whole, so it gets coordinates and a
+        # point the same way as on create
+        await prepare_location(app.mongodb, update_data, defer_geocoding)
+
+    query_filter: Dict[str, Any] = {"_id": object_id}
+    if has_if_match(request):
+        current = await app.mongodb["warehouses"].find_one({"_id": object_id})
+        if not current:
+            raise HTTPException(status_code=404, detail="Warehouse not found")
+        current_updated_at = current.get("updated_at")
+        current["id"] = str(current.pop("_id"))
+        check_if_match(request, content_etag(serialize(WarehouseResponse(**current))))
+        query_filter["updated_at"] = current_updated_at
 
     update_data["updated_at"] = datetime.utcnow()
 
-    result = await app.mongodb["warehouses"].update_one(
-        {"_id": object_id}, {"$set": update_data}
-    )
+    update: Dict[str, Any] = {"$set": update_data}
+    if "location" in update_data:
+        # a new location cancels any deferred geocoding job for the old one
+        update["$unset"] = {
+            field: "" for field in GEOCODE_JOB_FIELDS if field not in update_data
+        }
+
+    result = await app.mongodb["warehouses"].update_one(query_filter, update)
 
     if result.matched_count == 0:
+        if "updated_at" in query_filter:
+            raise HTTPException(
+                status_code=412,
+                detail="Precondition failed: the resource was modified by someone else",
+            )
         raise HTTPException(status_code=404, detail="Warehouse not found")
+    await invalidate_warehouses(str(object_id))
+    if "geocode_available_at" in update_data:
+        geocode_worker.notify()
 
     updated_warehouse = await app.mongodb["warehouses"].find_one({"_id": object_id})
 